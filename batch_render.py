@@ -0,0 +1,230 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from utilities.plot_data import (
+    ENERGY_BALANCE_SERIES,
+    create_map,
+    network_flows,
+    plot_chart,
+    plot_edges_playback,
+    plot_net_flows,
+    select_variables,
+    technology_operation_series,
+)
+from utilities.process_data import TIME_LEVELS
+from utilities.read_data import LazyResult
+
+SECTIONS = ["energy_balance", "technology_operation", "network_operation"]
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses the command line arguments
+
+    Arguments can also be read from a file, e.g. batch_render.py results @spec.txt,
+    with one argument per line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Renders figures of all AdOpT-NET0 result files in a directory",
+        fromfile_prefix_chars="@",
+    )
+    parser.add_argument("input_dir", type=Path, help="directory with .h5 files")
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, default=Path("figures"), help="output folder"
+    )
+    parser.add_argument(
+        "--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS)
+    )
+    parser.add_argument("--periods", nargs="+", help="default: all periods")
+    parser.add_argument("--nodes", nargs="+", help="default: all nodes")
+    parser.add_argument("--carriers", nargs="+", help="default: all carriers")
+    parser.add_argument("--technologies", nargs="+", help="default: all technologies")
+    parser.add_argument("--networks", nargs="+", help="default: all networks")
+    parser.add_argument(
+        "--levels",
+        nargs="+",
+        choices=TIME_LEVELS,
+        default=["Year", "Month"],
+        help="time aggregations",
+    )
+    parser.add_argument(
+        "--node-locations",
+        type=Path,
+        help="csv with node locations, required for network maps",
+    )
+    parser.add_argument(
+        "--format",
+        default="html",
+        choices=["html", "png", "svg", "pdf"],
+        help="format of charts, png, svg and pdf require vl-convert-python",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="parallel processes"
+    )
+
+    return parser.parse_args(arguments)
+
+
+def select(requested, available):
+    """
+    Returns the requested entries that are available, or all available entries if
+    nothing is requested
+    """
+    if not requested:
+        return list(available)
+    return [entry for entry in available if entry in requested]
+
+
+def save_chart(data, path, image_format):
+    """
+    Saves a chart of the data, if there is anything to show
+
+    :return: number of files written
+    """
+    if data.empty:
+        return 0
+    plot_chart(data).save(path.with_suffix("." + image_format))
+    return 1
+
+
+def render_energy_balance(result, selection, output_dir):
+    """
+    Renders the supply and demand at each selected node and carrier
+    """
+    count = 0
+    for period in select(selection.periods, result["topology"]["periods"]):
+        for node in select(selection.nodes, result["topology"]["nodes"]):
+            carriers = result.list_items("energybalance", period, node)
+            for carrier in select(selection.carriers, carriers):
+                for level in selection.levels:
+                    data = result.aggregate(
+                        "energybalance", period, node, carrier, level=level
+                    )
+                    for name, series in ENERGY_BALANCE_SERIES.items():
+                        path = output_dir / f"{period}_{node}_{carrier}_{level}_{name}"
+                        data_series = select_variables(data, series)
+                        count += save_chart(data_series, path, selection.format)
+
+    return count
+
+
+def render_technology_operation(result, selection, output_dir):
+    """
+    Renders the inputs, outputs and other variables of each selected technology
+    """
+    count = 0
+    for period in select(selection.periods, result["topology"]["periods"]):
+        for node in select(selection.nodes, result["topology"]["nodes"]):
+            technologies = result.list_items("technology_operation", period, node)
+            for technology in select(selection.technologies, technologies):
+                keys = (period, node, technology)
+                for level in selection.levels:
+                    series = technology_operation_series(
+                        result.aggregate("technology_operation", *keys, level=level),
+                        result.aggregate(
+                            "technology_operation",
+                            *keys,
+                            level=level,
+                            aggregation="mean",
+                        ),
+                    )
+                    for name, data in series.items():
+                        name = name.replace(" ", "_")
+                        path = (
+                            output_dir / f"{period}_{node}_{technology}_{level}_{name}"
+                        )
+                        count += save_chart(data, path, selection.format)
+
+    return count
+
+
+def render_network_operation(result, selection, output_dir, node_data):
+    """
+    Renders maps of the net flows of each selected network, played back over all
+    time slices of each time level
+    """
+    count = 0
+    for period in select(selection.periods, result["topology"]["periods"]):
+        networks = result.list_items("network_operation", period)
+        for network in select(selection.networks, networks):
+            for level in selection.levels:
+                net_flows, max_flows = network_flows(result, period, [network], level)
+                map = create_map(node_data)
+                if len(net_flows) == 1:
+                    plot_net_flows(
+                        map, node_data, net_flows, max_flows, net_flows.index[0]
+                    )
+                elif not plot_edges_playback(
+                    map, node_data, net_flows, max_flows, level, result.time_specs
+                ):
+                    print(f"Skipped {network} {level}: too many flows to play back")
+                    continue
+                map.save(output_dir / f"{period}_{network}_{level}.html")
+                count += 1
+
+    return count
+
+
+def render_result(path_h5, selection, node_data):
+    """
+    Renders all selected figures of a result file to a folder named after the file
+
+    :return: number of files written
+    """
+    result = LazyResult(path_h5)
+    result.load_all()
+
+    count = 0
+    for section in selection.sections:
+        output_dir = selection.output_dir / path_h5.stem / section
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if section == "energy_balance":
+            count += render_energy_balance(result, selection, output_dir)
+        elif section == "technology_operation":
+            count += render_technology_operation(result, selection, output_dir)
+        elif section == "network_operation" and "network_operation" in result:
+            count += render_network_operation(result, selection, output_dir, node_data)
+
+    return count
+
+
+def main(arguments=None):
+    selection = parse_arguments(arguments)
+    files = sorted(selection.input_dir.glob("*.h5"))
+
+    node_data = None
+    if selection.node_locations:
+        node_data = pd.read_csv(selection.node_locations, sep=";", index_col=0)
+    elif "network_operation" in selection.sections:
+        print("No node locations given, network maps are skipped")
+        selection.sections = [
+            section for section in selection.sections if section != "network_operation"
+        ]
+
+    with ProcessPoolExecutor(max_workers=max(1, selection.jobs)) as executor:
+        futures = {
+            executor.submit(render_result, path_h5, selection, node_data): path_h5
+            for path_h5 in files
+        }
+        failed = []
+        for future in as_completed(futures):
+            name = futures[future].name
+            try:
+                print(f"{name}: {future.result()} files written")
+            except Exception as error:
+                print(f"{name}: failed ({error!r})", file=sys.stderr)
+                failed.append(name)
+
+    if failed:
+        print(f"{len(failed)} of {len(files)} files failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.synthetic_results import (
+    synthetic_node_locations,
+    write_synthetic_result,
+)
+from utilities import result_cache
+from utilities.plot_data import (
+    ENERGY_BALANCE_SERIES,
+    create_map,
+    network_flows,
+    plot_chart,
+    plot_edges,
+    plot_edges_playback,
+    select_variables,
+)
+from utilities.process_data import aggregate_time_levels, compute_net_flows
+from utilities.read_data import LazyResult
+from utilities.result_cache import aggregation_cache, hash_file
+
+# Sizes of the synthetic results, see write_synthetic_result
+SCALES = {
+    "small": dict(nodes=3, technologies=2, carriers=2, periods=1, arcs=4),
+    "medium": dict(nodes=10, technologies=5, carriers=4, periods=1, arcs=20),
+    "large": dict(nodes=20, technologies=8, carriers=5, periods=2, arcs=50),
+    "clustered": dict(
+        nodes=10, technologies=5, carriers=4, periods=1, arcs=20, typical_days=20
+    ),
+}
+
+
+def stage_hash(path_h5, cache_dir):
+    """
+    Hashes the contents of the file, as for uploaded files; files on disk are
+    identified by their path, size and modification time without reading them
+    """
+
+    def run():
+        with open(path_h5, "rb") as file:
+            hash_file(file)
+
+    return run
+
+
+def stage_open(path_h5, cache_dir):
+    return lambda: LazyResult(path_h5)
+
+
+def stage_load(path_h5, cache_dir):
+    """
+    Reads and processes all sections with an empty disk cache
+    """
+
+    def run():
+        result_cache.CACHE_DIR = Path(tempfile.mkdtemp(dir=cache_dir))
+        LazyResult(path_h5).load_all()
+
+    return run
+
+
+def stage_load_cached(path_h5, cache_dir):
+    """
+    Loads all sections from the disk cache
+    """
+    result_cache.CACHE_DIR = Path(tempfile.mkdtemp(dir=cache_dir))
+    LazyResult(path_h5).load_all()
+    return lambda: LazyResult(path_h5).load_all()
+
+
+def stage_aggregate_time_levels(path_h5, cache_dir):
+    data = LazyResult(path_h5)["energybalance"]
+    return lambda: aggregate_time_levels(data)
+
+
+def stage_aggregate_lazy(path_h5, cache_dir):
+    """
+    Aggregates the energy balance at one node without loading the section
+    """
+    result = LazyResult(path_h5)
+    keys = [result["topology"][key][0] for key in ["periods", "nodes", "carriers"]]
+
+    def run():
+        aggregation_cache.clear()
+        result.aggregate("energybalance", *keys, level="Day")
+
+    return run
+
+
+def stage_net_flows(path_h5, cache_dir):
+    result = LazyResult(path_h5)
+    result.load_all()
+    period = result["topology"]["periods"][0]
+    data = result.aggregate("network_operation", period, level="Hour")
+    data = data.loc[:, data.columns.get_level_values("Variable") == "flow"]
+    return lambda: compute_net_flows(data)
+
+
+def stage_energy_balance_chart(path_h5, cache_dir):
+    result = LazyResult(path_h5)
+    result.load_all()
+    keys = [result["topology"][key][0] for key in ["periods", "nodes", "carriers"]]
+    data = result.aggregate("energybalance", *keys, level="Hour")
+    data = select_variables(data, ENERGY_BALANCE_SERIES["Supply"])
+    return lambda: plot_chart(data).to_dict()
+
+
+def stage_network_design_map(path_h5, cache_dir):
+    result = LazyResult(path_h5)
+    node_data = synthetic_node_locations(len(result["topology"]["nodes"]))
+    design = result["network_design"]
+    edges = design[["FromNode", "ToNode", "size"]].rename(columns={"size": "Value"})
+
+    def run():
+        map = create_map(node_data)
+        plot_edges(map, node_data, edges, "size", edges["Value"].max(), offset=0.02)
+        map.get_root().render()
+
+    return run
+
+
+def stage_network_playback_map(path_h5, cache_dir):
+    result = LazyResult(path_h5)
+    result.load_all()
+    node_data = synthetic_node_locations(len(result["topology"]["nodes"]))
+    period = result["topology"]["periods"][0]
+    networks = result.list_items("network_operation", period)
+    net_flows, max_flows = network_flows(result, period, networks, "Day")
+
+    def run():
+        map = create_map(node_data)
+        plot_edges_playback(
+            map, node_data, net_flows, max_flows, "Day", result.time_specs
+        )
+        map.get_root().render()
+
+    return run
+
+
+STAGES = {
+    "hash file": stage_hash,
+    "open result": stage_open,
+    "load all": stage_load,
+    "load all from cache": stage_load_cached,
+    "aggregate time levels": stage_aggregate_time_levels,
+    "aggregate slice lazily": stage_aggregate_lazy,
+    "net flows": stage_net_flows,
+    "energy balance chart": stage_energy_balance_chart,
+    "network design map": stage_network_design_map,
+    "network playback map": stage_network_playback_map,
+}
+
+
+def measure(run, repeats):
+    """
+    Measures the median wall time of repeated runs and the peak memory of one run
+
+    Peak memory is measured in a separate run, as tracing allocations slows down
+    the run.
+
+    :return: wall time in seconds and peak memory in MB
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return statistics.median(times), peak / 1e6
+
+
+def run_benchmarks(scales, stages, repeats, work_dir):
+    """
+    Generates a synthetic result for each scale and measures all stages on it
+
+    :return: dataframe with wall time and peak memory indexed by scale and stage
+    """
+    records = []
+    for scale in scales:
+        path_h5 = work_dir / f"{scale}.h5"
+        write_synthetic_result(path_h5, **SCALES[scale])
+        size = path_h5.stat().st_size / 1e6
+        for stage in stages:
+            # Each stage starts with an empty disk cache
+            cache_dir = work_dir / "cache"
+            cache_dir.mkdir()
+            result_cache.CACHE_DIR = cache_dir
+            aggregation_cache.clear()
+            wall_time, peak = measure(STAGES[stage](path_h5, cache_dir), repeats)
+            shutil.rmtree(cache_dir)
+            records.append(
+                {
+                    "Scale": scale,
+                    "Stage": stage,
+                    "File size [MB]": round(size, 1),
+                    "Wall time [s]": round(wall_time, 4),
+                    "Peak memory [MB]": round(peak, 1),
+                }
+            )
+            print(
+                f"{scale:>10} {stage:<25} {wall_time:8.3f} s {peak:8.1f} MB",
+                flush=True,
+            )
+
+    return pd.DataFrame(records).set_index(["Scale", "Stage"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures wall time and peak memory of loading and plotting "
+        "synthetic results"
+    )
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=list(SCALES))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--save", type=Path, help="saves the results to a json file")
+    parser.add_argument(
+        "--compare", type=Path, help="json file of earlier results to compare with"
+    )
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(
+            arguments.scales, arguments.stages, arguments.repeats, Path(work_dir)
+        )
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            earlier = pd.DataFrame(json.load(file)).set_index(["Scale", "Stage"])
+        for column in ["Wall time [s]", "Peak memory [MB]"]:
+            results[column + " ratio"] = (results[column] / earlier[column]).round(2)
+
+    print(results.to_string())
+
+    if arguments.save:
+        with open(arguments.save, "w") as file:
+            json.dump(results.reset_index().to_dict(orient="records"), file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
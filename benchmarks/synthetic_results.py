@@ -0,0 +1,156 @@
+import argparse
+
+import h5py
+import numpy as np
+import pandas as pd
+
+ENERGY_BALANCE_VARIABLES = [
+    "generic_production",
+    "technology_outputs",
+    "technology_inputs",
+    "network_inflow",
+    "network_outflow",
+    "import",
+    "export",
+    "demand",
+]
+
+
+def write_synthetic_result(
+    path_h5,
+    nodes=3,
+    technologies=2,
+    carriers=2,
+    periods=1,
+    networks=1,
+    arcs=4,
+    time_steps=8760,
+    typical_days=None,
+    time_stamps=False,
+    seed=0,
+):
+    """
+    Writes a result file with random values in the layout of AdOpT-NET0 results
+
+    :param path_h5: path of the file to write
+    :param int nodes: number of nodes
+    :param int technologies: number of technologies per node
+    :param int carriers: number of carriers
+    :param int periods: number of investment periods
+    :param int networks: number of networks
+    :param int arcs: number of node pairs per network, each connected in both
+        directions
+    :param int time_steps: number of hourly time steps of the horizon
+    :param int typical_days: if given, the operation is clustered to this number of
+        typical days and expanded with a k-means sequence
+    :param bool time_stamps: writes the time stamps of the horizon to the topology
+    :param int seed: seed of the random values
+    """
+    rng = np.random.default_rng(seed)
+    node_names = [f"node{i}" for i in range(nodes)]
+    carrier_names = [f"carrier{i}" for i in range(carriers)]
+    period_names = [f"period{i}" for i in range(periods)]
+    steps = typical_days * 24 if typical_days else time_steps
+
+    with h5py.File(path_h5, "w") as f:
+        f["topology/nodes"] = np.array(node_names, dtype="S")
+        f["topology/carriers"] = np.array(carrier_names, dtype="S")
+        f["topology/periods"] = np.array(period_names, dtype="S")
+        if time_stamps:
+            horizon = pd.date_range("2030-01-01", periods=time_steps, freq="h")
+            f["topology/time_stamps"] = np.array(horizon.astype(str), dtype="S")
+
+        f["summary/total_npv"] = rng.random()
+        f["summary/cost"] = rng.random()
+        f["summary/emissions_net"] = rng.random()
+        f["summary/time_stamp"] = b"synthetic"
+
+        f.create_group("k_means_specs")
+        for period in period_names:
+            if typical_days:
+                days = rng.integers(0, typical_days, -(-time_steps // 24))
+                sequence = (days[:, None] * 24 + np.arange(24)).ravel()
+                f[f"k_means_specs/{period}/sequence"] = sequence[:time_steps] + 1
+
+            for node in node_names:
+                group = f"operation/energy_balance/{period}/{node}"
+                for carrier in carrier_names:
+                    for variable in ENERGY_BALANCE_VARIABLES:
+                        f[f"{group}/{carrier}/{variable}"] = rng.random(steps)
+
+                for technology in range(technologies):
+                    name = f"technology{technology}"
+                    group = f"operation/technology_operation/{period}/{node}/{name}"
+                    f[f"{group}/{carrier_names[0]}_input"] = rng.random(steps)
+                    f[f"{group}/{carrier_names[-1]}_output"] = rng.random(steps)
+                    if technology % 2:
+                        f[f"{group}/storage_level"] = rng.random(steps)
+
+                    group = f"design/nodes/{period}/{node}/{name}"
+                    f[f"{group}/size"] = rng.random()
+                    f[f"{group}/capex_tot"] = rng.random()
+                    f[f"{group}/opex_fixed"] = rng.random()
+                    f[f"{group}/technology"] = name.encode()
+
+            for network in range(networks):
+                name = f"network{network}"
+                from_nodes = rng.integers(0, nodes, arcs)
+                to_nodes = (from_nodes + rng.integers(1, nodes, arcs)) % nodes
+                for arc in range(arcs):
+                    ends = (node_names[from_nodes[arc]], node_names[to_nodes[arc]])
+                    for direction, (start, end) in enumerate([ends, ends[::-1]]):
+                        arc_id = f"arc{arc}_{direction}"
+                        group = f"design/networks/{period}/{name}/{arc_id}"
+                        f[f"{group}/fromNode"] = start.encode()
+                        f[f"{group}/toNode"] = end.encode()
+                        f[f"{group}/network"] = name.encode()
+                        f[f"{group}/size"] = rng.random()
+                        f[f"{group}/capex"] = rng.random()
+                        f[f"{group}/total_flow"] = rng.random()
+
+                        group = f"operation/networks/{period}/{name}/{arc_id}"
+                        f[f"{group}/flow"] = rng.random(steps)
+                        f[f"{group}/losses"] = rng.random(steps)
+
+
+def synthetic_node_locations(nodes=3, seed=0):
+    """
+    Creates random node locations for the nodes of a synthetic result
+
+    :param int nodes: number of nodes
+    :param int seed: seed of the random locations
+    :return: dataframe with columns lon and lat indexed by node
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {"lon": rng.uniform(2, 8, nodes), "lat": rng.uniform(49, 54, nodes)},
+        index=pd.Index([f"node{i}" for i in range(nodes)], name="Node"),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes a synthetic AdOpT-NET0 result file"
+    )
+    parser.add_argument("path_h5")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--technologies", type=int, default=2)
+    parser.add_argument("--carriers", type=int, default=2)
+    parser.add_argument("--periods", type=int, default=1)
+    parser.add_argument("--networks", type=int, default=1)
+    parser.add_argument("--arcs", type=int, default=4)
+    parser.add_argument("--time-steps", type=int, default=8760)
+    parser.add_argument("--typical-days", type=int)
+    parser.add_argument("--time-stamps", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--node-locations", help="also writes node locations to this csv"
+    )
+    arguments = vars(parser.parse_args())
+
+    node_locations = arguments.pop("node_locations")
+    write_synthetic_result(**arguments)
+    if node_locations:
+        synthetic_node_locations(arguments["nodes"], arguments["seed"]).to_csv(
+            node_locations, sep=";"
+        )
@@ -9,7 +9,7 @@ st.markdown("**Detailed Optimization Results (.H5)**")
 load_result_data_in_cash()
 
 # Load Summary
-st.markdown("**Summary File (.XLSX)**")
+st.markdown("**Summary File (.XLSX, .CSV, .PARQUET)**")
 load_summary_data_in_cash()
 
 # Load Node Data
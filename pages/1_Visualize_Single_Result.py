@@ -6,12 +6,22 @@ from utilities import *
 # Session States
 manage_session_states()
 
+# Sections of the result needed by each graph
+PAGE_SECTIONS = {
+    "Technology Design": ["technology_design"],
+    "Network Design": ["network_design"],
+    "Energy Balance at Node": ["energybalance"],
+    "Technology Operation": ["technology_operation"],
+    "Network Operation": ["network_design", "network_operation"],
+}
+
 # Page Setup
 st.set_page_config(
     page_title="Visualize Single Result",
 )
 
-if st.session_state["Result1"]:
+if st.session_state["Results"]:
+    result = select_result()
 
     # Page to show
     st.sidebar.markdown("**Select a graph**")
@@ -29,28 +39,31 @@ st.sidebar.markdown("**Cash Status**")
 show_sidebar()
 st.sidebar.markdown("---")
 
-if st.session_state["Result1"]:
+if st.session_state["Results"] and wait_for_sections(
+    result, PAGE_SECTIONS[selected_page]
+):
     # Individual pages
-    if selected_page == "Technology Design":
-        plot_technology_design()
-    elif selected_page == "Network Design":
-        if isinstance(st.session_state["NodeLocations"], pd.DataFrame):
-            plot_network_design()
-        else:
-            st.markdown(
-                "Node Locations not loaded. Please upload them first in 'Load Data'."
-            )
-    elif selected_page == "Energy Balance at Node":
-        plot_energy_balance()
-    elif selected_page == "Technology Operation":
-        plot_technology_operation()
-    elif selected_page == "Network Operation":
-        if isinstance(st.session_state["NodeLocations"], pd.DataFrame):
-            plot_network_operation()
-        else:
-            st.markdown(
-                "Node Locations not loaded. Please upload them first in 'Load Data'."
-            )
+    with profile_plot(selected_page):
+        if selected_page == "Technology Design":
+            plot_technology_design(result)
+        elif selected_page == "Network Design":
+            if isinstance(st.session_state["NodeLocations"], pd.DataFrame):
+                plot_network_design(result)
+            else:
+                st.markdown(
+                    "Node Locations not loaded. Please upload them first in 'Load Data'."
+                )
+        elif selected_page == "Energy Balance at Node":
+            plot_energy_balance(result)
+        elif selected_page == "Technology Operation":
+            plot_technology_operation(result)
+        elif selected_page == "Network Operation":
+            if isinstance(st.session_state["NodeLocations"], pd.DataFrame):
+                plot_network_operation(result)
+            else:
+                st.markdown(
+                    "Node Locations not loaded. Please upload them first in 'Load Data'."
+                )
 
 else:
     st.markdown("Please load in data first")
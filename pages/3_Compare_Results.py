@@ -0,0 +1,31 @@
+import streamlit as st
+
+from utilities import *
+
+# Session States
+manage_session_states()
+
+# Page Setup
+st.set_page_config(
+    page_title="Compare Results",
+)
+
+# Show cash status
+st.sidebar.markdown("**Cash Status**")
+show_sidebar()
+st.sidebar.markdown("---")
+
+if len(st.session_state["Results"]) > 1:
+    results = get_results()
+    names = list(results)
+    selected_base = st.selectbox("**Base Result**", names)
+    selected_other = st.selectbox(
+        "**Compared Result**", [name for name in names if name != selected_base]
+    )
+    with profile_plot("Comparison"):
+        plot_result_difference(
+            results[selected_base],
+            results[selected_other],
+        )
+else:
+    st.markdown("Please load at least two results first")
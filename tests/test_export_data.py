@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.synthetic_results import write_synthetic_result
+from utilities import result_cache
+from utilities.export_data import EXPORT_FORMATS, export_section
+from utilities.read_data import LazyResult
+
+
+@pytest.fixture(scope="module")
+def result(tmp_path_factory):
+    path = tmp_path_factory.mktemp("results")
+    result_cache.CACHE_DIR = path / "cache"
+    write_synthetic_result(path / "result.h5", time_steps=48)
+    return LazyResult(path / "result.h5")
+
+
+@pytest.mark.parametrize("file_format", EXPORT_FORMATS)
+@pytest.mark.parametrize(
+    "section", ["energybalance", "technology_design", "network_operation"]
+)
+def test_export_can_be_served_by_streamlit(result, section, file_format):
+    file = export_section(result, section, (), file_format)
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        file, unsupported_error=TypeError("unsupported")
+    )
+    assert len(data) > 0
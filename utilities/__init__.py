@@ -1,2 +1,3 @@
 from .manage_cash import *
 from .plot_data import *
+from .export_data import *
@@ -0,0 +1,167 @@
+import gzip
+import io
+
+import h5py
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from .read_data import H5_SECTIONS, OPERATION_SECTIONS
+
+# Number of rows converted at once when writing an export
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "HDF5": (".h5", "application/x-hdf5"),
+}
+
+# Groups of the h5 file that are copied to every HDF5 export, so that the export
+# can be loaded again
+H5_EXPORT_GROUPS = ["topology", "summary", "k_means_specs"]
+
+
+def write_csv(df, file, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Writes a dataframe as gzip compressed csv, converting chunk_size rows at once
+
+    :param pd.DataFrame df: data to export
+    :param file: binary file object to write to
+    :param int chunk_size: number of rows converted at once
+    """
+    with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6) as zipped_file:
+        for start in range(0, max(len(df), 1), chunk_size):
+            chunk = df.iloc[start : start + chunk_size].to_csv(header=start == 0)
+            zipped_file.write(chunk.encode("utf-8"))
+
+
+def write_parquet(df, file, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Writes a dataframe as parquet with one row group per chunk_size rows
+
+    :param pd.DataFrame df: data to export
+    :param file: binary file object to write to
+    :param int chunk_size: number of rows converted at once
+    """
+    # Columns with mixed value types, e.g. from summaries, are exported as
+    # text, as in csv exports
+    mixed_columns = [
+        column
+        for column in df.columns[df.dtypes == object]
+        if pd.api.types.infer_dtype(df[column]) == "mixed"
+    ]
+    if mixed_columns:
+        df = df.astype({column: str for column in mixed_columns})
+
+    writer = None
+    for start in range(0, max(len(df), 1), chunk_size):
+        table = pa.Table.from_pandas(df.iloc[start : start + chunk_size])
+        if writer is None:
+            writer = pq.ParquetWriter(file, table.schema, compression="zstd")
+        writer.write_table(table)
+    writer.close()
+
+
+def write_h5_subset(hdf_file, groups, file):
+    """
+    Copies groups of a h5 file to a new h5 file
+
+    The groups are copied by h5py without reading them into dataframes. The
+    topology, summary and k-means specs are always copied, so that the subset can
+    be loaded as a result again.
+
+    :param hdf_file: open h5 file of the result
+    :param list groups: paths of the groups to copy
+    :param file: binary file object to write to
+    """
+    with h5py.File(file, "w") as subset:
+        for group in H5_EXPORT_GROUPS + groups:
+            if group in hdf_file and group not in subset:
+                subset.require_group(hdf_file[group].parent.name)
+                hdf_file.copy(hdf_file[group], subset, name=group)
+
+
+def export_section(result, section, keys, file_format):
+    """
+    Exports a section of a result, or the part of it below the given keys
+
+    Dataframes are converted in chunks of EXPORT_CHUNK_SIZE rows, so that no
+    complete text or arrow copy of them is held. The export itself is written to
+    memory, as Streamlit reads it completely to serve it anyway.
+
+    :param LazyResult result: result to export
+    :param str section: summary or a section of H5_SECTIONS
+    :param tuple keys: keys of the column levels of operation sections
+    :param str file_format: format of EXPORT_FORMATS
+    :return: file object positioned at the start of the export
+    """
+    file = io.BytesIO()
+
+    if file_format == "HDF5":
+        groups = ["/".join((H5_SECTIONS.get(section, section),) + keys)]
+        if section == "network_operation":
+            # The arcs of the network operation are defined in the network design
+            groups.append("/".join((H5_SECTIONS["network_design"],) + keys))
+        write_h5_subset(result.hdf_file, groups, file)
+    else:
+        if section in OPERATION_SECTIONS:
+            df = result.select(section, *keys)
+        else:
+            df = result[section]
+        if file_format == "Parquet":
+            write_parquet(df, file)
+        else:
+            write_csv(df, file)
+
+    file.seek(0)
+    return file
+
+
+def export_button(result, section, keys, label, file_name):
+    """
+    Shows a format selection and a button that exports a section of a result
+
+    The export is only generated when the button is clicked. Streamlit reads the
+    complete export into memory to serve it, so the memory needed for a download is
+    deferred to the click, but not bounded.
+
+    :param LazyResult result: result to export
+    :param str section: summary or a section of H5_SECTIONS
+    :param tuple keys: keys of the column levels of operation sections
+    :param str label: label of button
+    :param str file_name: file name of the export without extension
+    """
+    file_format = st.selectbox("Format", EXPORT_FORMATS.keys(), key="Format " + section)
+    extension, mime = EXPORT_FORMATS[file_format]
+    st.download_button(
+        label=label,
+        data=lambda: export_section(result, section, keys, file_format),
+        file_name=file_name + extension,
+        mime=mime,
+        key="Download " + section,
+    )
+
+
+def select_keys(result, section, levels):
+    """
+    Lets the user select keys of the column levels of an operation section, where
+    'All' selects all entries of a level and the levels below it
+
+    :param LazyResult result: result to export
+    :param str section: energybalance, technology_operation or network_operation
+    :param list levels: names of the column levels to select
+    :return: tuple of selected keys
+    """
+    keys = ()
+    for level in levels:
+        items = ["All"] + result.list_items(section, *keys)
+        selected_item = st.selectbox(
+            f"{level} Selection", items, key=f"{level} {section}"
+        )
+        if selected_item == "All":
+            break
+        keys = keys + (selected_item,)
+
+    return keys
@@ -1,8 +1,13 @@
 import streamlit as st
+import time
+from collections import deque
+from functools import partial
 from pathlib import Path
 import pandas as pd
 
-from .read_data import read_results_from_h5
+from .profiling import PROFILE_SIZE, profile_stage
+from .read_data import RESULTS_DIR, index_results_dir, read_summary, result_store
+from .result_cache import CACHE_SIZE, aggregation_cache, get_cache_size, result_memory
 
 
 def show_sidebar():
@@ -11,6 +16,7 @@ def show_sidebar():
     """
     clear_cash()
     show_cash_status()
+    show_profile()
 
 
 def manage_session_states():
@@ -19,10 +25,16 @@ def manage_session_states():
     """
     if "Summary" not in st.session_state:
         st.session_state["Summary"] = None
-    if "Result1" not in st.session_state:
-        st.session_state["Result1"] = {}
+    if "SummaryFile" not in st.session_state:
+        st.session_state["SummaryFile"] = None
+    if "Results" not in st.session_state:
+        st.session_state["Results"] = {}
+    if "ResultFiles" not in st.session_state:
+        st.session_state["ResultFiles"] = {}
     if "NodeLocations" not in st.session_state:
         st.session_state["NodeLocations"] = None
+    if "Profile" not in st.session_state:
+        st.session_state["Profile"] = deque(maxlen=PROFILE_SIZE)
 
 
 def show_cash_status():
@@ -36,16 +48,129 @@ def show_cash_status():
     else:
         st.sidebar.error("Summary file not loaded")
 
-    if st.session_state["Result1"]:
-        st.sidebar.success("Results 1 successfully loaded")
+    if st.session_state["Results"]:
+        st.sidebar.success(
+            f"{len(st.session_state['Results'])} result(s) successfully loaded"
+        )
+        show_disk_cache_status(get_results())
     else:
-        st.sidebar.error("Results 1 not loaded")
+        st.sidebar.error("Results not loaded")
 
     if isinstance(st.session_state["NodeLocations"], pd.DataFrame):
         st.sidebar.success("Node locations successfully loaded")
     else:
         st.sidebar.error("Node locations not loaded")
 
+    show_memory_usage()
+
+
+def show_memory_usage():
+    """
+    Displays the in-memory size of each dataset of the session with buttons to drop
+    them, and the memory used by the results of all sessions
+
+    Sections of results that are shared with other sessions cannot be dropped.
+    :return:
+    """
+    datasets = {}
+    for name, handle in st.session_state["Results"].items():
+        result = handle.result
+        shared = result_store.count_references(handle.result_id) > 1
+        for section, size in result.section_sizes().items():
+            drop = None if shared else partial(result.drop, section)
+            datasets[f"{name}: {section}"] = (size, drop)
+    for key, label in [("Summary", "Summary"), ("NodeLocations", "Node locations")]:
+        if isinstance(st.session_state[key], pd.DataFrame):
+            size = st.session_state[key].memory_usage(deep=True).sum()
+            datasets[label] = (size, partial(drop_session_data, key))
+
+    with st.sidebar.expander("Memory usage"):
+        for label, (size, drop) in datasets.items():
+            column_label, column_button = st.columns([3, 1])
+            column_label.caption(f"{label}: {size / 1e6:.1f} MB")
+            column_button.button(
+                "Drop",
+                key="Drop " + label,
+                on_click=drop,
+                disabled=drop is None,
+                help="Shared with other sessions" if drop is None else None,
+            )
+        st.caption(
+            f"All sessions: {len(result_store)} results, "
+            f"{result_memory.get_size() / 1e6:.0f} of "
+            f"{result_memory.max_size / 1e6:.0f} MB used, "
+            f"{result_memory.evictions} sections evicted"
+        )
+
+
+def drop_session_data(key):
+    """
+    Removes the summary or the node locations from the session; they are loaded
+    again from the uploaded file on the 'Load Data' page
+    :param str key: Summary or NodeLocations
+    :return:
+    """
+    st.session_state[key] = None
+    if key == "Summary":
+        st.session_state["SummaryFile"] = None
+
+
+def show_disk_cache_status(results):
+    """
+    Displays which sections of the results were read from the disk cache and the
+    usage of the aggregation cache and the disk cache
+    :param dict results: loaded results
+    :return:
+    """
+    for name, result in results.items():
+        status = result.cache_status.items()
+        hits = [key for key, value in status if value == "hit"]
+        misses = [key for key, value in status if value == "miss"]
+        if hits:
+            st.sidebar.info(f"{name} - disk cache hit: " + ", ".join(hits))
+        if misses:
+            st.sidebar.warning(f"{name} - disk cache miss: " + ", ".join(misses))
+    st.sidebar.caption(
+        f"Aggregation cache: {aggregation_cache.hits} hits, "
+        f"{aggregation_cache.misses} misses, "
+        f"{aggregation_cache.size / 1e6:.1f} of "
+        f"{aggregation_cache.max_size / 1e6:.0f} MB used"
+    )
+    st.sidebar.caption(
+        f"Disk cache: {get_cache_size() / 1e9:.2f} of {CACHE_SIZE / 1e9:.0f} GB used"
+    )
+
+
+def show_profile():
+    """
+    Displays the wall time, bytes read and peak memory of the last loading and
+    plotting stages in the sidebar
+    :return:
+    """
+    records = [
+        {"Result": name, **record}
+        for name, result in get_results().items()
+        for record in result.profile
+    ]
+    records += [{"Result": None, **record} for record in st.session_state["Profile"]]
+    if not records:
+        return
+
+    profile = pd.DataFrame(records)
+    profile["Bytes read"] = profile["Bytes read"] / 1e6
+    profile = profile.rename(columns={"Bytes read": "Read [MB]"})
+    with st.sidebar.expander("Profiling"):
+        st.dataframe(profile.round(3), hide_index=True)
+
+
+def profile_plot(name):
+    """
+    Measures the time and memory spent on creating a plot, shown in the sidebar
+    :param str name: name of the plot
+    :return: context manager
+    """
+    return profile_stage(st.session_state["Profile"], "Plotting", name)
+
 
 def clear_cash():
     """
@@ -53,9 +178,11 @@ def clear_cash():
     :return:
     """
     if st.sidebar.button("Reset data"):
-        st.session_state["Result1"] = {}
+        st.session_state["Results"] = {}
+        st.session_state["ResultFiles"] = {}
         st.session_state["NodeLocations"] = None
         st.session_state["Summary"] = None
+        st.session_state["SummaryFile"] = None
 
 
 def load_summary_data_in_cash():
@@ -64,29 +191,163 @@ def load_summary_data_in_cash():
     :return:
     """
     st.markdown(
-        "In this section, you can load a summary csv file for visualization. "
+        "In this section, you can load a summary file (xlsx, csv or parquet) for "
+        "visualization. "
         "After sucessfully loading the data, you can select 'Visualize "
         "Summary' on the sidebar."
     )
-    uploaded_summary = st.file_uploader("Load a summary xlsx")
-    if uploaded_summary is not None:
-        st.session_state["Summary"] = pd.read_excel(uploaded_summary)
+    uploaded_summary = st.file_uploader(
+        "Load a summary file", type=["xlsx", "csv", "parquet"]
+    )
+    if (
+        uploaded_summary is not None
+        and st.session_state["SummaryFile"] != uploaded_summary.file_id
+    ):
+        st.session_state["Summary"] = read_summary(uploaded_summary)
+        st.session_state["SummaryFile"] = uploaded_summary.file_id
 
 
 def load_result_data_in_cash():
     """
     Loads results into cash
+
+    Several files can be loaded at once and are kept under their file names. If
+    complete files are loaded, several files are read in parallel processes and a
+    single file is loaded in the background, section by section. Files that are already loaded, also in other
+    sessions, are not read again. If a results directory is configured, its files
+    can be opened in place instead of being uploaded.
     :return:
     """
     st.markdown(
-        "In this section, you can load a h5 files to visualize. After "
+        "In this section, you can load one or several h5 files to visualize. After "
         "sucessfully loading the data, "
         "you can select 'Visualize Single Result'"
     )
 
-    uploaded_h5 = st.file_uploader("Load a result h5 file (case 1)")
-    if uploaded_h5 is not None:
-        st.session_state["Result1"] = read_results_from_h5(uploaded_h5)
+    uploaded_h5 = st.file_uploader(
+        "Load result h5 files", type="h5", accept_multiple_files=True
+    )
+    read_all = st.checkbox(
+        "Load complete files",
+        help="Several new files are read completely in parallel processes. A single "
+        "file, and files that are already open, are loaded in the background; the "
+        "sections that are usually looked at first come first and can be plotted "
+        "as soon as they are loaded. Otherwise, data is only read from the file "
+        "when it is plotted",
+    )
+
+    files = {Path(file.name).stem: (file, file.file_id) for file in uploaded_h5}
+    if RESULTS_DIR:
+        files.update(select_results_from_dir())
+
+    new_files = {}
+    for name, (file, file_id) in files.items():
+        if st.session_state["ResultFiles"].get(name) != file_id:
+            new_files[name] = file
+
+    if new_files:
+        status = {name: st.progress(0, text=f"Loading {name}") for name in new_files}
+
+        def show_progress(name, value, text):
+            status[name].progress(value, text=text)
+
+        handles = result_store.load(new_files, read_all, show_progress)
+        for name in new_files:
+            st.session_state["Results"][name] = handles[name]
+            st.session_state["ResultFiles"][name] = files[name][1]
+
+    for name, result in get_results().items():
+        if read_all:
+            result.load_in_background()
+        if result.pending:
+            st.info(f"{name}: loading " + ", ".join(result.pending))
+        show_loading_times(name, result)
+
+
+def select_results_from_dir():
+    """
+    Shows the result files of the results directory on the server with their size
+    and modification time and lets the user select files to open
+    :return: dict with the path and an id (path and modification time) of each
+        selected file by name
+    """
+    index = index_results_dir(RESULTS_DIR)
+    st.dataframe(index.drop(columns="Path"))
+    selected_names = st.multiselect(
+        "Open results from the server",
+        index.index,
+        help="Files are opened in place, without uploading them",
+    )
+
+    selected_files = {}
+    for name in selected_names:
+        path, modified = index.at[name, "Path"], index.at[name, "Modified"]
+        selected_files[name] = (path, f"{path} {modified}")
+
+    return selected_files
+
+
+def get_results():
+    """
+    Returns the results of the session
+
+    The session only holds handles to results, which are shared with other sessions
+    that loaded the same files and must not be modified.
+    :return: dict of results by name
+    """
+    return {name: handle.result for name, handle in st.session_state["Results"].items()}
+
+
+def select_result():
+    """
+    Shows a selection of the loaded results in the sidebar
+    :return: selected result
+    """
+    results = st.session_state["Results"]
+    selected_result = st.sidebar.selectbox(
+        "**Result Selection**", list(results), key="SelectedResult"
+    )
+
+    return results[selected_result].result
+
+
+def wait_for_sections(result, sections, interval=1):
+    """
+    Shows that sections are still loading in the background and reruns the page
+    once they are loaded
+    :param result: result to show
+    :param list sections: sections needed by the page
+    :param float interval: seconds between checks
+    :return: True if all sections can be used
+    """
+    loading = [section for section in sections if result.is_loading(section)]
+    if not loading:
+        return True
+
+    st.info("Still loading " + ", ".join(loading) + "...")
+    time.sleep(interval)
+    st.rerun()
+
+
+def show_loading_times(name, result):
+    """
+    Shows the time spent in each stage of reading and processing each section of
+    a result
+    :param str name: name of the result
+    :param result: loaded result
+    :return:
+    """
+    if result.profile:
+        with st.expander(f"Loading times {name}"):
+            profile = pd.DataFrame(result.profile).fillna({"Section": "all"})
+            timings = profile.pivot_table(
+                index="Section",
+                columns="Stage",
+                values="Wall time [s]",
+                aggfunc="sum",
+                fill_value=0,
+            )
+            st.dataframe(timings.round(3))
 
 
 def load_node_data_in_cash():
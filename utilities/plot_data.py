@@ -1,42 +1,99 @@
 import streamlit as st
 import altair as alt
 import pandas as pd
+import numpy as np
 import folium
-from folium.features import DivIcon
 from branca.colormap import linear
-from folium.plugins import PolyLineTextPath, PolyLineOffset
+from folium.plugins import TimestampedGeoJson
 from streamlit_folium import st_folium
 
-from .process_data import aggregate_time
+from .process_data import compute_net_flows, downsample_min_max, timeslice_start
+from .read_data import OPERATION_SECTIONS, compare_results
 
+# Maximal number of points passed to a chart and minimal number of time slices shown
+MAX_CHART_POINTS = 5000
+MIN_CHART_TIMESLICES = 500
 
-def plot_chart(df):
+# Variables of the energy balance shown as supply and demand
+ENERGY_BALANCE_SERIES = {
+    "Supply": ["generic_production", "technology_outputs", "network_inflow", "import"],
+    "Demand": ["demand", "technology_inputs", "network_outflow", "export"],
+}
+
+# Maximal number of (edge, time slice) features sent to the browser for playback
+MAX_PLAYBACK_FEATURES = 200000
+
+# Period between time slices, duration an edge is shown and date format for playback
+PLAYBACK_PERIODS = {
+    "Hour": (None, None, "YYYY-MM-DD HH:mm"),
+    "Day": ("P1D", "PT23H", "YYYY-MM-DD"),
+    "Week": ("P7D", "P6D", "YYYY-MM-DD"),
+    "Month": ("P1M", "P27D", "YYYY-MM"),
+    "Year": ("P1Y", "P364D", "YYYY"),
+}
+
+
+def plot_chart(df, stack=True):
     """
     Plots an altair area chart
+
+    Columns with the same name are summed before the data is passed to the chart,
+    and long time series are downsampled to the minimum and maximum of buckets of
+    time slices, so that the chart receives at most MAX_CHART_POINTS points.
+
+    :param pd.DataFrame df: data with time slices as rows
+    :param bool stack: stacks the series as areas, otherwise they are drawn as lines
     """
-    df = df.reset_index()
-    df = pd.melt(df, value_vars=df.columns, id_vars=["Timeslice"])
+    df = df.T.groupby(level=0, sort=False).sum().T
+    max_rows = max(MIN_CHART_TIMESLICES, MAX_CHART_POINTS // max(len(df.columns), 1))
+    df = downsample_min_max(df, max_rows)
+    df = df.rename_axis(index="Timeslice").reset_index()
+    df = pd.melt(df, id_vars=["Timeslice"], var_name="Variable")
 
     if len(df["Timeslice"].unique()) == 1:
-        chart = (
-            alt.Chart(df)
-            .mark_bar()
-            .encode(x="Timeslice:Q", y="sum(value):Q", color="Variable:N")
-            .configure_legend(orient="bottom")
-            .interactive()
-        )
+        chart = alt.Chart(df).mark_bar()
+    elif stack:
+        chart = alt.Chart(df).mark_area()
     else:
-        chart = (
-            alt.Chart(df)
-            .mark_area()
-            .encode(x="Timeslice:Q", y="sum(value):Q", color="Variable:N")
-            .configure_legend(orient="bottom")
-            .interactive()
+        chart = alt.Chart(df).mark_line()
+    chart = (
+        chart.encode(
+            x="Timeslice:Q",
+            y=alt.Y("value:Q", stack="zero" if stack else None),
+            color="Variable:N",
         )
+        .configure_legend(orient="bottom")
+        .interactive()
+    )
 
     return chart
 
 
+def select_time_window(timeslices):
+    """
+    Lets the user select a window of time slices, if there are more time slices than
+    a chart shows at full resolution
+
+    :param pd.Index timeslices: time slices of the data
+    :return: slice of the selected time slices
+    """
+    if len(timeslices) <= MIN_CHART_TIMESLICES:
+        return slice(None)
+
+    first, last = st.slider(
+        "**Time Window**",
+        min_value=int(timeslices.min()),
+        max_value=int(timeslices.max()),
+        value=(int(timeslices.min()), int(timeslices.max())),
+    )
+    st.caption(
+        "Long time windows show the minimum and maximum of buckets of time "
+        f"slices, windows up to {MIN_CHART_TIMESLICES} time slices are shown at "
+        "full resolution."
+    )
+    return slice(first, last)
+
+
 def plot_summary(data):
     # Select graph
     all_graphs = ["Line Chart", "Scatter Plot"]
@@ -47,8 +104,10 @@ def plot_summary(data):
     selected_x = st.selectbox("**Select x value**", all_vars)
     selected_y = st.multiselect("**Select y values**", all_vars)
 
-    plot_data = data.reset_index().melt(id_vars=["index", selected_x])
-    plot_data = plot_data[plot_data["variable"].isin(selected_y)]
+    # Only the selected columns are melted
+    selected_y = [column for column in selected_y if column != selected_x]
+    plot_data = data[[selected_x] + selected_y].reset_index()
+    plot_data = plot_data.melt(id_vars=["index", selected_x], value_vars=selected_y)
 
     if selected_chart == "Line Chart":
         chart = (
@@ -80,30 +139,215 @@ def plot_summary(data):
 
 
 def plot_nodes(map, node_data):
-    for node_name, data in node_data.iterrows():
-        folium.CircleMarker(
-            location=[data["lat"], data["lon"]],
-            radius=5,  # Adjust the radius as needed
-            color="black",  # Marker color
+    """
+    Plots all nodes with their names as a single GeoJSON layer
+
+    :param map: folium map
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    """
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [
+                    round(float(data["lon"]), 5),
+                    round(float(data["lat"]), 5),
+                ],
+            },
+            "properties": {"name": node_name},
+        }
+        for node_name, data in node_data.iterrows()
+    ]
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        marker=folium.CircleMarker(
+            radius=5,
+            color="black",
             fill=True,
-            fill_color="black",  # Fill color
+            fill_color="black",
             fill_opacity=0.7,
-        ).add_to(map)
-        folium.map.Marker(
-            [data["lat"], data["lon"]],
-            icon=DivIcon(
-                icon_size=(150, 36),
-                icon_anchor=(-5, 20),
-                html='<div style="font-size: 9pt">' + node_name + "</div>",
-            ),
-        ).add_to(map)
+        ),
+        tooltip=folium.GeoJsonTooltip(
+            fields=["name"],
+            labels=False,
+            permanent=True,
+            direction="right",
+            style="font-size: 9pt; background: none; border: none; box-shadow: none",
+        ),
+    ).add_to(map)
+
+
+def edge_coordinates(node_data, from_nodes, to_nodes, offset=0.0):
+    """
+    Computes the geometry of edges with an arrow head in their middle pointing to
+    the to node, for all edges at once
+
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    :param from_nodes: from node of each edge
+    :param to_nodes: to node of each edge
+    :param float offset: shift of each edge to its right relative to its length,
+        separates edges between the same nodes in opposite directions
+    :return: array with the (lon, lat) coordinates of start, end, left arrow head,
+        middle and right arrow head of each edge
+    """
+    start = node_data.loc[from_nodes, ["lon", "lat"]].to_numpy(dtype=float)
+    end = node_data.loc[to_nodes, ["lon", "lat"]].to_numpy(dtype=float)
+
+    direction = end - start
+    length = np.linalg.norm(direction, axis=1, keepdims=True)
+    unit = direction / np.where(length > 0, length, 1)
+    normal = np.column_stack([unit[:, 1], -unit[:, 0]])
+    start = start + offset * length * normal
+    end = end + offset * length * normal
+
+    # Arrow heads in the middle of each edge
+    middle = (start + end) / 2
+    head_size = 0.08 * length
+    head_left = middle - head_size * (0.87 * unit - 0.5 * normal)
+    head_right = middle - head_size * (0.87 * unit + 0.5 * normal)
+
+    coordinates = np.stack([start, end, head_left, middle, head_right], axis=1)
+
+    return coordinates.round(5)
+
+
+def edge_styles(normalized_values):
+    """
+    Determines color and weight of edges from their values
+
+    :param normalized_values: values of the edges within [0, 1]
+    :return: list of leaflet styles
+    """
+    color_scale = linear.OrRd_09.scale(0, 1)
+    return [
+        {"color": color_scale(value)[:7], "weight": round(2.5 + 2 * value, 2)}
+        for value in np.clip(normalized_values, 0, 1).tolist()
+    ]
+
+
+def edges_to_geojson(node_data, edges, offset=0.0):
+    """
+    Converts edges to a GeoJSON feature collection
+
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    :param pd.DataFrame edges: edges with columns FromNode and ToNode, all other
+        columns are written to the properties of the features
+    :param float offset: shift of each edge to its right relative to its length
+    :return: dict of the feature collection
+    """
+    coordinates = edge_coordinates(
+        node_data, edges["FromNode"], edges["ToNode"], offset
+    )
+    properties = edges.drop(columns=["FromNode", "ToNode"]).to_dict(orient="records")
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "MultiLineString",
+                "coordinates": [edge[0:2].tolist(), edge[2:5].tolist()],
+            },
+            "properties": edge_properties,
+        }
+        for edge, edge_properties in zip(coordinates, properties)
+    ]
+
+    return {"type": "FeatureCollection", "features": features}
 
 
-def plot_technology_design():
+def plot_edges(map, node_data, edges, value_name, max_value, offset=0.0):
+    """
+    Plots edges as a single GeoJSON layer, colored and weighted by their value
+
+    :param map: folium map
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    :param pd.DataFrame edges: edges with columns FromNode, ToNode and Value
+    :param str value_name: name of the value shown in the tooltip
+    :param float max_value: value shown with the darkest color
+    :param float offset: shift of each edge to its right relative to its length
+    """
+    if edges.empty:
+        return
+
+    styles = edge_styles(edges["Value"] / max_value)
+    edges = edges.assign(Value=edges["Value"].round(3), style=styles)
+
+    # Without a style function, folium styles each feature with its style property
+    folium.GeoJson(
+        edges_to_geojson(node_data, edges, offset),
+        tooltip=folium.GeoJsonTooltip(fields=["Value"], aliases=[value_name]),
+    ).add_to(map)
+
+
+def plot_edges_playback(map, node_data, net_flows, max_flows, level, time_specs):
+    """
+    Adds the net flows of all time slices to a map as one timestamped GeoJSON layer,
+    that is sent to the browser once and played back there
+
+    :param map: folium map
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    :param pd.DataFrame net_flows: net flows with time slices as rows and columns
+        (FromNode, ToNode)
+    :param pd.Series max_flows: value shown with the darkest color in each time slice
+    :param str level: time level of the time slices
+    :param dict time_specs: start and resolution of the time horizon
+    :return: False if there are too many edges to play back
+    """
+    values = net_flows.to_numpy()
+    slices, arcs = np.nonzero(values > 0.1)
+    if len(slices) > MAX_PLAYBACK_FEATURES:
+        return False
+
+    times = timeslice_start(net_flows.index, level, **time_specs)
+    times = (times - pd.Timestamp("1970-01-01")) // pd.Timedelta("1ms")
+
+    # Each arrow is drawn as one line: start, middle, left arrow head, middle, right
+    # arrow head, middle, end
+    coordinates = edge_coordinates(
+        node_data,
+        net_flows.columns.get_level_values("FromNode"),
+        net_flows.columns.get_level_values("ToNode"),
+    )
+    paths = coordinates[:, [0, 3, 2, 3, 4, 3, 1]].tolist()
+    flows = values[slices, arcs]
+    styles = edge_styles(flows / max_flows.to_numpy()[slices])
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": paths[arc]},
+            "properties": {
+                "times": [int(times[timeslice])] * 7,
+                "style": style,
+                "tooltip": f"Net flow: {flow:.3f}",
+            },
+        }
+        for timeslice, arc, flow, style in zip(slices, arcs, flows, styles)
+    ]
+
+    period, duration, date_format = PLAYBACK_PERIODS[level]
+    if level == "Hour":
+        resolution = pd.Timedelta(time_specs["resolution"])
+        period = resolution.isoformat()
+        duration = (resolution - pd.Timedelta("1s")).isoformat()
+    TimestampedGeoJson(
+        {"type": "FeatureCollection", "features": features},
+        period=period,
+        duration=duration,
+        date_options=date_format,
+        add_last_point=False,
+        auto_play=False,
+        transition_time=100,
+    ).add_to(map)
+
+    return True
+
+
+def plot_technology_design(result):
     """
     Plots the technology design
     """
-    data = st.session_state["Result1"]["technology_design"]
+    data = result["technology_design"]
     data = data[data["Variable"] != "technology"]
 
     all_periods = data["Period"].unique()
@@ -137,17 +381,30 @@ def plot_technology_design():
         st.altair_chart(chart, use_container_width=True)
 
 
-def plot_energy_balance():
+def select_variables(data, variables):
+    """
+    Selects the columns of the given variables and labels them by variable
+
+    :param pd.DataFrame data: data with a column level Variable
+    :param list variables: variables to select
+    :return: dataframe with the variables as columns
+    """
+    data = data.loc[:, data.columns.get_level_values("Variable").isin(variables)]
+    data.columns = data.columns.get_level_values("Variable")
+    return data
+
+
+def plot_energy_balance(result):
     """
     Plots the energy balance
     """
-    all_periods = st.session_state["Result1"]["topology"]["periods"]
+    all_periods = result["topology"]["periods"]
     selected_period = st.selectbox("**Period Selection**", all_periods)
 
-    carriers = st.session_state["Result1"]["topology"]["carriers"]
+    carriers = result["topology"]["carriers"]
     selected_carrier = st.selectbox("**Carrier Selection**", carriers)
 
-    nodes = st.session_state["Result1"]["topology"]["nodes"]
+    nodes = result["topology"]["nodes"]
     selected_node = st.selectbox("**Node Selection**", nodes)
 
     time_agg_options = {
@@ -159,66 +416,79 @@ def plot_energy_balance():
     }
     time_agg = st.selectbox("**Time Aggregation**", time_agg_options.keys())
 
-    data = st.session_state["Result1"]["energybalance"]
-
-    data = data.loc[
-        :, (selected_period, selected_node, selected_carrier, slice(None), slice(None))
-    ]
-    aggregated_data = aggregate_time(data, time_agg_options[time_agg])
+    aggregated_data = result.aggregate(
+        "energybalance",
+        selected_period,
+        selected_node,
+        selected_carrier,
+        level=time_agg_options[time_agg],
+    )
+    aggregated_data = aggregated_data.loc[select_time_window(aggregated_data.index)]
 
     st.header("Supply")
-    series_supply = [
-        "generic_production",
-        "technology_outputs",
-        "network_inflow",
-        "import",
-    ]
+    series_supply = ENERGY_BALANCE_SERIES["Supply"]
     selected_supply_series = st.multiselect(
         "Select Series to Filter", series_supply, default=series_supply
     )
 
-    plot_data = aggregated_data.loc[
-        :,
-        aggregated_data.columns.get_level_values("Variable").isin(
-            selected_supply_series
-        ),
-    ]
-    plot_data.columns = plot_data.columns.get_level_values("Variable")
+    plot_data = select_variables(aggregated_data, selected_supply_series)
     chart = plot_chart(plot_data)
     st.altair_chart(chart, theme="streamlit", use_container_width=True)
 
     st.header("Demand")
     # Multi-select box for filtering series
-    series_demand = ["demand", "technology_inputs", "network_outflow", "export"]
+    series_demand = ENERGY_BALANCE_SERIES["Demand"]
     selected_demand_series = st.multiselect(
         "Select Series to Filter", series_demand, default=series_demand
     )
-    plot_data = aggregated_data.loc[
-        :,
-        aggregated_data.columns.get_level_values("Variable").isin(
-            selected_demand_series
-        ),
-    ]
-    plot_data.columns = plot_data.columns.get_level_values("Variable")
+    plot_data = select_variables(aggregated_data, selected_demand_series)
     chart = plot_chart(plot_data)
     st.altair_chart(chart, theme="streamlit", use_container_width=True)
 
 
-def plot_technology_operation():
+def technology_operation_series(data_sum, data_mean):
+    """
+    Splits the operation of a technology into inputs, outputs and other variables
+
+    Storage levels are averaged over the time slices, all other variables are summed.
+
+    :param pd.DataFrame data_sum: operation summed over time slices
+    :param pd.DataFrame data_mean: operation averaged over time slices
+    :return: dict of dataframes with the variables as columns
+    """
+    variables = data_sum.columns.get_level_values("Variable")
+    variables_in = [x for x in variables if x.endswith("input")]
+    variables_out = [x for x in variables if x.endswith("output")]
+    variables_other = [
+        x for x in variables if x not in variables_in and x not in variables_out
+    ]
+
+    data_other = select_variables(data_sum, variables_other)
+    levels = data_other.columns.str.contains("level")
+    data_other.loc[:, levels] = select_variables(data_mean, variables_other).loc[
+        :, levels
+    ]
+
+    return {
+        "Input": select_variables(data_sum, variables_in),
+        "Output": select_variables(data_sum, variables_out),
+        "Other Variables": data_other,
+    }
+
+
+def plot_technology_operation(result):
     """
     Plots technology operation
     """
-    all_periods = st.session_state["Result1"]["topology"]["periods"]
+    all_periods = result["topology"]["periods"]
     selected_period = st.selectbox("**Period Selection**", all_periods)
 
-    nodes = st.session_state["Result1"]["topology"]["nodes"]
+    nodes = result["topology"]["nodes"]
     selected_node = st.selectbox("**Node Selection**", nodes)
 
-    data = st.session_state["Result1"]["technology_operation"]
-
-    data = data.loc[:, (selected_period, selected_node, slice(None), slice(None))]
-
-    technologies = data.columns.get_level_values("Technology").unique()
+    technologies = result.list_items(
+        "technology_operation", selected_period, selected_node
+    )
     selected_technology = st.selectbox("**Technology Selection**", technologies)
 
     time_agg_options = {
@@ -230,66 +500,37 @@ def plot_technology_operation():
     }
     time_agg = st.selectbox("**Time Aggregation**", time_agg_options.keys())
 
-    data = data.loc[:, (selected_period, slice(None), selected_technology, slice(None))]
-    aggregated_data_sum = aggregate_time(data, time_agg_options[time_agg])
-    aggregated_data_mean = aggregate_time(
-        data, time_agg_options[time_agg], aggregation="mean"
+    keys = (selected_period, selected_node, selected_technology)
+    aggregated_data_sum = result.aggregate(
+        "technology_operation", *keys, level=time_agg_options[time_agg]
+    )
+    aggregated_data_mean = result.aggregate(
+        "technology_operation",
+        *keys,
+        level=time_agg_options[time_agg],
+        aggregation="mean",
+    )
+    window = select_time_window(aggregated_data_sum.index)
+    series = technology_operation_series(
+        aggregated_data_sum.loc[window], aggregated_data_mean.loc[window]
     )
 
-    st.header("Input")
-    variables_in = [
-        col
-        for col in aggregated_data_sum.columns.get_level_values("Variable")
-        if col.endswith("input")
-    ]
-    plot_data = aggregated_data_sum.loc[
-        :, (selected_period, slice(None), slice(None), variables_in)
-    ]
-    plot_data.columns = plot_data.columns.get_level_values("Variable")
-    if not plot_data.empty:
-        chart = plot_chart(plot_data)
-        st.altair_chart(chart, theme="streamlit", use_container_width=True)
-    else:
-        st.markdown("Nothing to show")
-
-    # Output
-    st.header("Output")
-    variables_out = [
-        col
-        for col in aggregated_data_sum.columns.get_level_values("Variable")
-        if col.endswith("output")
-    ]
-    plot_data = aggregated_data_sum.loc[
-        :, (selected_period, slice(None), slice(None), variables_out)
-    ]
-    plot_data.columns = plot_data.columns.get_level_values("Variable")
-    if not plot_data.empty:
-        chart = plot_chart(plot_data)
-        st.altair_chart(chart, theme="streamlit", use_container_width=True)
-    else:
-        st.markdown("Nothing to show")
+    for header in ["Input", "Output"]:
+        st.header(header)
+        plot_data = series[header]
+        if not plot_data.empty:
+            chart = plot_chart(plot_data)
+            st.altair_chart(chart, theme="streamlit", use_container_width=True)
+        else:
+            st.markdown("Nothing to show")
 
     st.header("Other Variables")
-    variables_other = [
-        x
-        for x in aggregated_data_sum.columns.get_level_values("Variable")
-        if ((x not in variables_in) & (x not in variables_out))
-    ]
+    variables_other = list(series["Other Variables"].columns)
     selected_series = st.multiselect(
         "Select Series to Filter", variables_other, default=variables_other
     )
-    plot_data = aggregated_data_sum.loc[
-        :, (selected_period, slice(None), slice(None), selected_series)
-    ]
-    plot_data.columns = plot_data.columns.get_level_values("Variable")
-    plot_data_mean = aggregated_data_mean.loc[
-        :, (selected_period, slice(None), slice(None), selected_series)
-    ]
-    plot_data_mean.columns = plot_data_mean.columns.get_level_values("Variable")
-
-    mask_sum = plot_data.columns.str.contains("level")
-    mask_mean = plot_data_mean.columns.str.contains("level")
-    plot_data.loc[:, mask_sum] = plot_data_mean.loc[:, mask_mean]
+    plot_data = series["Other Variables"]
+    plot_data = plot_data.loc[:, plot_data.columns.isin(selected_series)]
 
     if not plot_data.empty:
         chart = plot_chart(plot_data)
@@ -298,11 +539,67 @@ def plot_technology_operation():
         st.markdown("Nothing to show")
 
 
-def plot_network_design():
+def create_map(node_data):
+    """
+    Creates a map centered on the nodes and plots the nodes
+
+    :param pd.DataFrame node_data: node locations with columns lat and lon
+    :return: folium map
+    """
+    map_center = [node_data["lat"].mean(), node_data["lon"].mean()]
+    map = folium.Map(location=map_center, zoom_start=5)
+    plot_nodes(map, node_data)
+
+    return map
+
+
+def network_flows(result, period, networks, level):
+    """
+    Computes the net flows between nodes of the given networks aggregated to a time
+    level
+
+    :param LazyResult result: result to plot
+    :param str period: investment period
+    :param list networks: networks to include
+    :param str level: Year, Month, Week, Day or Hour
+    :return: net flows with columns (FromNode, ToNode) and the maximal flow of
+        each time slice
+    """
+    aggregated_data = pd.concat(
+        [
+            result.aggregate("network_operation", period, network, level=level)
+            for network in networks
+        ],
+        axis=1,
+    )
+    aggregated_data = aggregated_data.loc[
+        :, aggregated_data.columns.get_level_values("Variable") == "flow"
+    ]
+
+    return compute_net_flows(aggregated_data), aggregated_data.max(axis=1)
+
+
+def plot_net_flows(map, node_data, net_flows, max_flows, timeslice):
+    """
+    Plots the net flows of one time slice as edges on a map
+
+    :param map: folium map
+    :param pd.DataFrame node_data: node locations
+    :param pd.DataFrame net_flows: net flows with columns (FromNode, ToNode)
+    :param pd.Series max_flows: maximal flow of each time slice
+    :param timeslice: time slice to plot
+    """
+    net_flow = net_flows.loc[timeslice]
+    edges = net_flow[net_flow > 0.1]
+    edges = edges.rename("Value").rename_axis(["FromNode", "ToNode"]).reset_index()
+    plot_edges(map, node_data, edges, "Net flow", max_flows.loc[timeslice])
+
 
-    all_periods = st.session_state["Result1"]["topology"]["periods"]
+def plot_network_design(result):
+
+    all_periods = result["topology"]["periods"]
     selected_period = st.selectbox("**Period Selection**", all_periods)
-    data = st.session_state["Result1"]["network_design"]
+    data = result["network_design"]
 
     networks_available = list(data["Network"].unique())
     selected_netw = st.multiselect("Select a network:", networks_available)
@@ -316,66 +613,36 @@ def plot_network_design():
 
     selected_variable = st.selectbox("Select a variable:", variables_available)
 
-    # Init map
     node_data = st.session_state["NodeLocations"]
-    map_center = [node_data["lat"].mean(), node_data["lon"].mean()]
-    map = folium.Map(location=map_center, zoom_start=5)
-
-    # Plot nodes
-    plot_nodes(map, node_data)
+    map = create_map(node_data)
 
     data = data[data["Network"].isin(selected_netw)]
     data = data[data["Period"].isin([selected_period])]
     if not data.empty:
 
         arc_ids = data[["Arc_ID", "FromNode", "ToNode"]]
-        data = data.groupby("Arc_ID").sum()
-        data.drop(columns=["FromNode", "ToNode", "Network"], inplace=True)
+        data = data.groupby("Arc_ID", observed=True).sum(numeric_only=True)
         data = data.merge(arc_ids, on="Arc_ID")
 
         # Plot edges
         if selected_variable in ["size", "capex", "total_flow"]:
-            # Determine color scale:
             max_value = max(data[selected_variable])
             if max_value > 0:
-                color_scale = linear.OrRd_09.scale(0, 1)
-
-                for _, edge_data in data.iterrows():
-                    from_node_data = node_data.loc[edge_data.FromNode]
-                    to_node_data = node_data.loc[edge_data.ToNode]
-
-                    # Normalize edge value to be within [0, 1]
-                    normalized_value = (edge_data[selected_variable]) / max_value
-
-                    # Determine color based on the color scale
-                    color = color_scale(normalized_value)
-                    if normalized_value > 0.001:
-                        line = folium.plugins.PolyLineOffset(
-                            [
-                                (from_node_data["lat"], from_node_data["lon"]),
-                                (to_node_data["lat"], to_node_data["lon"]),
-                            ],
-                            color=color,
-                            weight=3.5,  # Set a default weight
-                            opacity=1,
-                            offset=3,
-                            tooltip=edge_data[selected_variable],
-                        ).add_to(map)
-                        attr = {"font-weight": "bold", "font-size": "13"}
-
-                        folium.plugins.PolyLineTextPath(
-                            line, "      >", repeat=True, offset=5, attributes=attr
-                        ).add_to(map)
+                edges = data[["FromNode", "ToNode", selected_variable]]
+                edges = edges.rename(columns={selected_variable: "Value"})
+                edges = edges[edges["Value"] / max_value > 0.001]
+                plot_edges(
+                    map, node_data, edges, selected_variable, max_value, offset=0.02
+                )
 
     st_folium(map, width=725)
 
 
-def plot_network_operation():
+def plot_network_operation(result):
 
-    data = st.session_state["Result1"]["network_operation"]
-    all_periods = st.session_state["Result1"]["topology"]["periods"]
+    all_periods = result["topology"]["periods"]
     selected_period = st.selectbox("**Period Selection**", all_periods)
-    networks = data.columns.get_level_values(1).unique()
+    networks = result.list_items("network_operation", selected_period)
     selected_network = st.multiselect("**Network Selection**", networks)
 
     time_agg_options = {
@@ -387,87 +654,107 @@ def plot_network_operation():
     }
 
     time_agg = st.selectbox("**Time Aggregation**", time_agg_options.keys())
-    data = data.loc[
-        :,
-        (
-            selected_period,
-            selected_network,
-            slice(None),
-            "flow",
-            slice(None),
-            slice(None),
-        ),
-    ]
-    aggregated_data = aggregate_time(data, time_agg_options[time_agg])
+    if not selected_network:
+        st.markdown("Select a network to show")
+        return
 
-    if time_agg != "Annual Totals":
+    # Net flows of all time slices, the slider only selects a row
+    net_flows, max_flows = network_flows(
+        result, selected_period, selected_network, time_agg_options[time_agg]
+    )
+
+    playback = len(net_flows) > 1 and st.checkbox(
+        "Play back all time slices",
+        help="Sends the flows of all time slices to the browser at once",
+    )
+    if len(net_flows) > 1 and not playback:
         selected_timeslice = st.slider(
             "Select a time slice: ",
-            min_value=min(aggregated_data.index),
-            max_value=max(aggregated_data.index),
+            min_value=min(net_flows.index),
+            max_value=max(net_flows.index),
         )
-        aggregated_data = aggregated_data[aggregated_data.index == selected_timeslice]
-
-    data = aggregated_data.T
-
-    data.columns = ["Flow"]
-    data = data.reset_index()
-
-    arc_ids = data[["Arc_ID", "FromNode", "ToNode"]]
-    data = data.groupby("Arc_ID").sum()
-    data.drop(columns=["FromNode", "ToNode", "Network"], inplace=True)
-    data = data.merge(arc_ids, on="Arc_ID")
+    else:
+        selected_timeslice = net_flows.index[0]
 
-    # Init map
     node_data = st.session_state["NodeLocations"]
-    map_center = [node_data["lat"].mean(), node_data["lon"].mean()]
-    map = folium.Map(location=map_center, zoom_start=5)
-
-    # Plot nodes
-    plot_nodes(map, node_data)
+    map = create_map(node_data)
 
     # Plot edges
-    if not data.empty:
+    if playback:
+        if not plot_edges_playback(
+            map,
+            node_data,
+            net_flows,
+            max_flows,
+            time_agg_options[time_agg],
+            result.time_specs,
+        ):
+            st.markdown(
+                "Too many flows to play back, please select a coarser time aggregation"
+            )
+        st_folium(map, width=725, returned_objects=[])
+        return
 
-        max_value = max(data["Flow"])
-        color_scale = linear.OrRd_09.scale(0, 1)
+    plot_net_flows(map, node_data, net_flows, max_flows, selected_timeslice)
 
-        for _, edge_data in data.iterrows():
-            from_node_data = node_data.loc[edge_data.FromNode]
-            to_node_data = node_data.loc[edge_data.ToNode]
+    st_folium(map, width=725)
 
-            # Normalize edge value to be within [0, 1]
-            flow_this_direction = edge_data["Flow"]
 
-            flow_other_direction = data[
-                (data["FromNode"] == to_node_data.name)
-                & (data["ToNode"] == from_node_data.name)
-            ]
+def plot_result_difference(base, other):
+    """
+    Plots the differences between the operation of two results
+    """
+    sections = {
+        "Energy Balance": ("energybalance", 3),
+        "Technology Operation": ("technology_operation", 3),
+        "Network Operation": ("network_operation", 2),
+    }
+    selected_section = st.selectbox("**Data Selection**", sections.keys())
+    section, num_keys = sections[selected_section]
+
+    keys = ()
+    for level in OPERATION_SECTIONS[section][1][:num_keys]:
+        items_base = base.list_items(section, *keys)
+        items_other = other.list_items(section, *keys)
+        items = items_base + [item for item in items_other if item not in items_base]
+        if not items:
+            st.markdown("Nothing to show")
+            return
+        selected_item = st.selectbox(f"**{level} Selection**", items)
+        if selected_item not in items_other:
+            st.caption(f"{selected_item} only exists in the base result")
+        elif selected_item not in items_base:
+            st.caption(f"{selected_item} only exists in the compared result")
+        keys = keys + (selected_item,)
 
-            uni_flow = (
-                flow_this_direction - flow_other_direction.loc[:, "Flow"].values[0]
-            )
+    time_agg_options = {
+        "Annual Totals": "Year",
+        "Monthly Totals": "Month",
+        "Weekly Totals": "Week",
+        "Daily Totals": "Day",
+        "Hourly Totals": "Hour",
+    }
+    time_agg = st.selectbox("**Time Aggregation**", time_agg_options.keys())
+    difference = st.radio("**Difference**", ["Absolute", "Relative"], horizontal=True)
+
+    data = compare_results(
+        base, other, section, *keys, level=time_agg_options[time_agg]
+    )[difference]
+    data = data.loc[select_time_window(data.index)]
+    data.columns = [
+        " ".join(labels) if isinstance(labels, tuple) else labels
+        for labels in data.columns.droplevel(list(range(num_keys)))
+    ]
 
-            if uni_flow > 0.1:
-                normalized_value = uni_flow / max_value
-
-                # # Determine color based on the color scale
-                color = color_scale(normalized_value)
-                line = folium.plugins.PolyLineOffset(
-                    [
-                        (from_node_data["lat"], from_node_data["lon"]),
-                        (to_node_data["lat"], to_node_data["lon"]),
-                    ],
-                    color=color,
-                    weight=3.5,  # Set a default weight
-                    opacity=1,
-                    offset=0,
-                    tooltip=str(uni_flow),
-                ).add_to(map)
-                attr = {"font-weight": "bold", "font-size": "13"}
-
-                folium.plugins.PolyLineTextPath(
-                    line, "      >", repeat=True, offset=5, attributes=attr
-                ).add_to(map)
+    selected_series = st.multiselect(
+        "Select Series to Filter", list(data.columns), default=list(data.columns)
+    )
+    plot_data = data.loc[:, data.columns.isin(selected_series)]
+    if plot_data.empty:
+        st.markdown("Nothing to show")
+        return
+    if difference == "Relative":
+        st.caption("Relative differences are shown as zero where the base is zero")
 
-    st_folium(map, width=725)
+    chart = plot_chart(plot_data, stack=difference == "Absolute")
+    st.altair_chart(chart, theme="streamlit", use_container_width=True)
@@ -1,36 +1,301 @@
+import functools
+
 import h5py
 import numpy as np
 import pandas as pd
-import streamlit as st
+
+TIME_LEVELS = ["Year", "Month", "Week", "Day", "Hour"]
+
+# Time horizon assumed if a results file does not contain time stamps
+DEFAULT_START = "2008-01-01 00:00"
+DEFAULT_RESOLUTION = "1h"
 
 
-@st.cache_data
 def aggregate_time(df, level, aggregation="sum"):
-    if aggregation == "sum":
-        df = df.groupby(level=level).sum()
-    elif aggregation == "mean":
-        df = df.groupby(level=level).mean()
-    df.index.names = ["Timeslice"]
-    return df
+    """
+    Aggregates a dataframe with a time index to a time level
+
+    :param pd.DataFrame df: dataframe with time index (see add_time_steps_to_df)
+    :param str level: Year, Month, Week, Day or Hour
+    :param str aggregation: sum or mean
+    :return: aggregated dataframe with Timeslice index
+    """
+    return aggregate_time_levels(df, [level], [aggregation])[(level, aggregation)]
 
 
-def add_time_steps_to_df(df):
+def aggregate_time_levels(df, levels=TIME_LEVELS, aggregations=("sum", "mean")):
     """
-    Adds time index to a df
+    Aggregates a dataframe with a time index to several time levels
+
+    As the time slices of each level are consecutive rows, sums are computed for all
+    columns at once with np.add.reduceat over the time axis and means are derived
+    from them.
+
+    :param pd.DataFrame df: dataframe with time index (see add_time_steps_to_df)
+    :param list levels: time levels to aggregate to
+    :param list aggregations: sum and/or mean
+    :return: dict with the aggregated dataframe for each (level, aggregation)
+    """
+    values = df.to_numpy()
+    aggregated = {}
+    for level in levels:
+        timeslices = df.index.get_level_values(level).to_numpy()
+        if np.any(timeslices[1:] < timeslices[:-1]):
+            for aggregation in aggregations:
+                data = df.groupby(level=level).agg(aggregation)
+                data.index.names = ["Timeslice"]
+                aggregated[(level, aggregation)] = data
+            continue
+
+        starts = np.flatnonzero(np.r_[True, timeslices[1:] != timeslices[:-1]])
+        index = pd.Index(timeslices[starts], name="Timeslice")
+        if len(starts) == len(timeslices):
+            sums = values
+        else:
+            # Sums of float32 values are accumulated in float64
+            sums = np.add.reduceat(values, starts, axis=0, dtype=np.float64)
+            sums = sums.astype(values.dtype, copy=False)
+        for aggregation in aggregations:
+            if aggregation == "sum":
+                data = sums
+            elif len(starts) == len(timeslices):
+                data = values
+            else:
+                counts = np.diff(np.r_[starts, len(timeslices)])
+                data = (sums / counts[:, np.newaxis]).astype(sums.dtype, copy=False)
+            aggregated[(level, aggregation)] = pd.DataFrame(
+                data, index=index, columns=df.columns, copy=False
+            )
+
+    return aggregated
+
+
+def build_selection_index(columns):
+    """
+    Maps the keys of the first levels of a column index to the positions of their
+    columns and to the entries of the next level below them
+
+    Columns below the same keys are usually consecutive, their positions are then
+    stored as a slice, so that selecting them with iloc returns a view.
+
+    :param pd.MultiIndex columns: column index
+    :return: dict with tuples of keys of the first levels, from none to all levels,
+        as keys and the positions (slice or array) of their columns and the list of
+        entries of the next level as values
+    """
+    positions = {}
+    items = {}
+    for position, key in enumerate(columns):
+        for depth in range(columns.nlevels + 1):
+            positions.setdefault(key[:depth], []).append(position)
+            if depth < columns.nlevels:
+                items.setdefault(key[:depth], {})[key[depth]] = None
+
+    selection_index = {}
+    for keys, key_positions in positions.items():
+        first, last = key_positions[0], key_positions[-1]
+        if last - first == len(key_positions) - 1:
+            key_positions = slice(first, last + 1)
+        else:
+            key_positions = np.array(key_positions)
+        selection_index[keys] = (key_positions, list(items.get(keys, ())))
+
+    return selection_index
+
+
+def compact_frame(df):
+    """
+    Converts the float64 columns of a dataframe to float32 and its text columns to
+    categoricals
+
+    :param pd.DataFrame df: dataframe to convert
+    :return: converted dataframe
+    """
+    dtypes = {}
+    for column in df.columns:
+        if df[column].dtype == np.float64:
+            dtypes[column] = np.float32
+        elif pd.api.types.infer_dtype(df[column]) == "string":
+            dtypes[column] = "category"
+
+    return df.astype(dtypes)
+
+
+def downsample_min_max(df, max_rows):
+    """
+    Downsamples a dataframe to the time slices with the minimal and maximal total of
+    all columns in each of max_rows / 2 buckets, so that peaks are kept
+
+    :param pd.DataFrame df: dataframe with time slices as rows
+    :param int max_rows: maximal number of rows to keep
+    :return: downsampled dataframe
+    """
+    if len(df) <= max_rows:
+        return df
+
+    total = df.sum(axis=1).to_numpy()
+    bounds = np.linspace(0, len(df), max_rows // 2 + 1).astype(int)
+    buckets = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    # Sorted by bucket and total, the first and last row of each bucket are its
+    # minimum and maximum
+    order = np.lexsort((total, buckets))
+    rows = np.union1d(order[bounds[:-1]], order[bounds[1:] - 1])
+
+    return df.iloc[rows]
+
+
+def compute_net_flows(flows):
+    """
+    Computes the net flow between each pair of nodes for all time slices at once
+
+    Flows of arcs connecting the same nodes in the same direction are summed. The
+    reverse direction of each node pair is found with a single join of (FromNode,
+    ToNode) on (ToNode, FromNode); node pairs without a reverse arc keep their flow.
+
+    :param pd.DataFrame flows: flows with time slices as rows and column levels
+        FromNode and ToNode
+    :return: dataframe of net flows with columns (FromNode, ToNode)
     """
-    num_rows = len(df)
-    hour = np.repeat(np.arange(1, num_rows + 1), 1)[0:num_rows]
-    day = np.repeat(np.arange(1, num_rows + 1), 24)[0:num_rows]
-    week = np.repeat(np.arange(1, num_rows + 1), 24 * 7)[0:num_rows]
-    month = (
-        pd.date_range(start="2008-01-01 00:00", end="2008-12-31 00:00", freq="1h")
-        .month[0:num_rows]
-        .to_list()
+    flows = flows.T.groupby(level=["FromNode", "ToNode"]).sum().T
+    reverse_arcs = pd.MultiIndex.from_arrays(
+        [
+            flows.columns.get_level_values("ToNode"),
+            flows.columns.get_level_values("FromNode"),
+        ]
     )
-    year = np.ones(num_rows)
+    positions = flows.columns.get_indexer(reverse_arcs)
 
-    df.index = pd.MultiIndex.from_arrays(
-        [hour, day, week, month, year], names=["Hour", "Day", "Week", "Month", "Year"]
+    values = flows.to_numpy()
+    reverse_values = np.where(positions >= 0, values[:, positions], 0)
+
+    return pd.DataFrame(
+        values - reverse_values, index=flows.index, columns=flows.columns
+    )
+
+
+def compute_difference(base, other):
+    """
+    Computes the absolute and relative differences between the data of two results
+    for all columns and time slices at once
+
+    Columns are aligned by their labels; columns that exist in only one of the
+    results are taken as zero in the other one. Rows are aligned by their labels if
+    the time indexes differ. The relative difference refers to the base and is NaN
+    where the base is zero.
+
+    :param pd.DataFrame base: data of the base result
+    :param pd.DataFrame other: data of the compared result with the same column
+        levels
+    :return: dataframe with the columns of both results below an additional first
+        column level Difference (Absolute, Relative)
+    """
+    if not base.index.equals(other.index):
+        index = base.index.intersection(other.index, sort=False)
+        base = base.loc[index]
+        other = other.loc[index]
+    columns = base.columns.union(other.columns, sort=False)
+
+    # Values of both results in the order of the aligned columns
+    values = np.zeros((2, len(columns), len(base)))
+    values[0, columns.get_indexer(base.columns)] = base.to_numpy().T
+    values[1, columns.get_indexer(other.columns)] = other.to_numpy().T
+
+    differences = np.empty((2 * len(columns), len(base)))
+    np.subtract(values[1], values[0], out=differences[: len(columns)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(
+            differences[: len(columns)],
+            np.abs(values[0]),
+            out=differences[len(columns) :],
+        )
+    differences[len(columns) :][values[0] == 0] = np.nan
+
+    difference_columns = pd.MultiIndex.from_arrays(
+        [np.repeat(["Absolute", "Relative"], len(columns))]
+        + [
+            np.tile(columns.get_level_values(level), 2)
+            for level in range(columns.nlevels)
+        ],
+        names=["Difference"] + list(columns.names),
     )
 
+    return pd.DataFrame(
+        differences.T, index=base.index, columns=difference_columns, copy=False
+    )
+
+
+def timeslice_start(
+    timeslices, level, start=DEFAULT_START, resolution=DEFAULT_RESOLUTION
+):
+    """
+    Determines the first time stamp of time slices (see build_time_index)
+
+    :param timeslices: numbers of the time slices
+    :param str level: Year, Month, Week, Day or Hour
+    :param str start: first time stamp of the time horizon
+    :param str resolution: length of a time step
+    :return: pd.DatetimeIndex
+    """
+    start = pd.Timestamp(start)
+    offsets = np.asarray(timeslices) - 1
+
+    if level == "Hour":
+        return start + pd.to_timedelta(offsets * pd.Timedelta(resolution))
+    elif level == "Day":
+        return start.normalize() + pd.to_timedelta(offsets, unit="D")
+    elif level == "Week":
+        return start.normalize() + pd.to_timedelta(7 * offsets, unit="D")
+
+    freq = {"Month": "M", "Year": "Y"}[level]
+    periods = pd.period_range(start=start, periods=offsets.max() + 1, freq=freq)
+    return periods[offsets].to_timestamp()
+
+
+def add_time_steps_to_df(df, start=DEFAULT_START, resolution=DEFAULT_RESOLUTION):
+    """
+    Adds time index to a df
+
+    All dataframes with the same number of time steps share one index object.
+
+    :param pd.DataFrame df: dataframe with one row per time step
+    :param str start: first time stamp of the time horizon
+    :param str resolution: length of a time step
+    :return: dataframe with time index
+    """
+    df.index = build_time_index(len(df), start, resolution)
+
     return df
+
+
+@functools.lru_cache(maxsize=16)
+def build_time_index(num_rows, start=DEFAULT_START, resolution=DEFAULT_RESOLUTION):
+    """
+    Builds a time index with the levels Hour (time step), Day, Week, Month and Year
+
+    Days, months and years follow the calendar and are counted from the start of the
+    time horizon, so that horizons over several years are aggregated correctly.
+    Weeks are blocks of seven days.
+
+    :param int num_rows: number of time steps
+    :param str start: first time stamp of the time horizon
+    :param str resolution: length of a time step
+    :return: pd.MultiIndex
+    """
+    start = np.datetime64(pd.Timestamp(start), "s")
+    step = np.timedelta64(pd.Timedelta(resolution)).astype("timedelta64[s]")
+    time_stamps = start + np.arange(num_rows) * step
+
+    def count_from_start(unit):
+        stamps = time_stamps.astype("datetime64[" + unit + "]")
+        return (stamps - start.astype("datetime64[" + unit + "]")).astype(int) + 1
+
+    hour = np.arange(1, num_rows + 1)
+    day = count_from_start("D")
+    week = (day - 1) // 7 + 1
+    month = count_from_start("M")
+    year = count_from_start("Y")
+
+    return pd.MultiIndex.from_arrays(
+        [hour, day, week, month, year], names=["Hour", "Day", "Week", "Month", "Year"]
+    )
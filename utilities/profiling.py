@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Writes every profiled stage as a json line to this file, or to stderr if it is "-"
+PROFILE_LOG = os.environ.get("VISUALIZATION_PROFILE_LOG")
+
+# Number of profiled stages kept per result or session
+PROFILE_SIZE = 200
+
+logger = logging.getLogger("visualization.profile")
+if PROFILE_LOG:
+    if PROFILE_LOG == "-":
+        handler = logging.StreamHandler()
+    else:
+        handler = logging.FileHandler(PROFILE_LOG)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Measured seconds per byte of each stage and section, used to estimate the progress
+# of loads. Keys are stage names or (stage, section).
+stage_rates = {"Reading": 1e-8, "Processing": 2e-8}
+_rates_lock = threading.Lock()
+
+# Number of stages that are currently measured in all threads. The peak memory is
+# only measured for stages that start while no other stage is measured, as it is a
+# value of the whole process.
+_active_stages = 0
+_active_lock = threading.Lock()
+
+
+def read_memory():
+    """
+    Reads the current and the peak memory (resident set size) of the process
+
+    :return: current and peak memory in bytes, or None if not available (only on
+        Linux)
+    """
+    memory = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory[line[:5]] = int(line.split()[1]) * 1024
+    except OSError:
+        return None, None
+
+    return memory.get("VmRSS"), memory.get("VmHWM")
+
+
+def reset_peak_memory():
+    """
+    Resets the peak memory of the process to its current memory
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+@contextmanager
+def profile_stage(records, stage, section=None, **labels):
+    """
+    Measures wall time and peak memory of a stage and appends them to records
+
+    The stage can add the number of bytes it read to the yielded record. Peak memory
+    is the peak resident set size of the whole process during the stage above the
+    memory at its start, including other threads. It is only measured for stages
+    that start while no other stage is measured, in any thread; it is None for
+    nested and concurrent stages.
+
+    :param records: list of records to append to
+    :param str stage: name of the stage, e.g. Reading
+    :param str section: section of the result the stage works on
+    :param labels: additional fields for the json log, e.g. the result id
+    :return: record with the field "Bytes read"
+    """
+    global _active_stages
+
+    record = {"Stage": stage, "Section": section, "Bytes read": 0}
+    with _active_lock:
+        measure_peak = _active_stages == 0
+        _active_stages += 1
+        if measure_peak:
+            memory, _ = read_memory()
+            reset_peak_memory()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["Wall time [s]"] = time.perf_counter() - start
+        record["Peak memory [MB]"] = None
+        with _active_lock:
+            _active_stages -= 1
+            if measure_peak and memory is not None:
+                peak = read_memory()[1]
+                if peak:
+                    record["Peak memory [MB]"] = max(peak - memory, 0) / 1e6
+        records.append(record)
+        if PROFILE_LOG:
+            logger.info(json.dumps({**record, **labels}, default=str))
+
+
+def update_rate(stage, section, num_bytes, duration):
+    """
+    Updates the measured seconds per byte of a stage, overall and per section
+
+    :param str stage: name of the stage
+    :param str section: section the stage worked on
+    :param int num_bytes: number of bytes processed in the stage
+    :param float duration: wall time of the stage in seconds
+    """
+    if num_bytes <= 0:
+        return
+    rate = duration / num_bytes
+    with _rates_lock:
+        for key in [stage, (stage, section)]:
+            if key in stage_rates:
+                stage_rates[key] = (stage_rates[key] + rate) / 2
+            else:
+                stage_rates[key] = rate
+
+
+def estimate_duration(stage, section, num_bytes):
+    """
+    Estimates the duration of a stage from earlier measurements
+
+    :param str stage: name of the stage
+    :param str section: section the stage works on
+    :param int num_bytes: number of bytes to process
+    :return: estimated duration in seconds
+    """
+    with _rates_lock:
+        return num_bytes * stage_rates.get((stage, section), stage_rates[stage])
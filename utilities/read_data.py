@@ -1,60 +1,92 @@
+import atexit
+import contextlib
+import importlib.util
+import io
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
 import h5py
 import numpy as np
 import pandas as pd
 import streamlit as st
 
-from .process_data import add_time_steps_to_df
-
+from .process_data import (
+    DEFAULT_RESOLUTION,
+    DEFAULT_START,
+    add_time_steps_to_df,
+    aggregate_time,
+    aggregate_time_levels,
+    build_selection_index,
+    build_time_index,
+    compact_frame,
+    compute_difference,
+)
+from .profiling import PROFILE_SIZE, estimate_duration, profile_stage, update_rate
+from .result_cache import (
+    COMPACT_RESULTS,
+    aggregation_cache,
+    cached_section_path,
+    frame_size,
+    hash_file,
+    read_cached_section,
+    result_memory,
+    write_cached_section,
+)
 
-@st.cache_data
-def load_nodes_from_h5_results(path):
-    """
-    Loads all nodes contained in a results file as a list
-    """
-    with h5py.File(path) as hdf_file:
-        nodes = extract_data_from_h5_dataset(hdf_file["topology/nodes"])
+# Directory with result files on the server that can be opened in place instead of
+# being uploaded
+RESULTS_DIR = os.environ.get("VISUALIZATION_RESULTS_DIR")
 
-    return nodes
 
-
-@st.cache_data
-def load_carriers_from_h5_results(path):
-    """
-    Loads all carriers contained in a results file as a list
+def read_dataset(dataset, file_map=None):
     """
-    with h5py.File(path) as hdf_file:
-        carriers = extract_data_from_h5_dataset(hdf_file["topology/carriers"])
-
-    return carriers
+    Reads a dataset of an h5 file
 
+    Contiguous numeric datasets are returned as read-only views of file_map, so that
+    they are not copied until they are processed. Chunked or compressed datasets
+    have no single offset in the file and are read by h5py. Views must only be used
+    for data that is formatted or copied right away: accessing a view of a file that
+    was truncated meanwhile crashes the process (SIGBUS) instead of raising.
 
-@st.cache_data
-def load_periods_from_h5_results(path):
+    :param dataset: dataset of h5 file
+    :param file_map: memory map or buffer of the complete h5 file, or None
+    :return: array, or list with the value of a scalar dataset
     """
-    Loads all carriers contained in a results file as a list
-    """
-    with h5py.File(path) as hdf_file:
-        periods = extract_data_from_h5_dataset(hdf_file["topology/periods"])
+    if dataset.shape == ():
+        return [dataset[()]]
+    if file_map is not None and dataset.dtype.kind in "biuf":
+        offset = dataset.id.get_offset()
+        if offset is not None:
+            return np.frombuffer(file_map, dataset.dtype, dataset.size, offset).reshape(
+                dataset.shape
+            )
 
-    return periods
+    return dataset[:]
 
 
-def extract_datasets_from_h5_group(group, prefix=()):
+def extract_datasets_from_h5_group(group, prefix=(), file_map=None):
     """
     Gets all datasets from a group of an h5 file and writes it to a multi-index dataframe
 
     :param group: group of h5 file
+    :param file_map: memory map of the h5 file (see read_dataset)
     :return: dataframe containing all datasets in group
     """
     data = {}
     for key, value in group.items():
         if isinstance(value, h5py.Group):
-            data.update(extract_datasets_from_h5_group(value, prefix + (key,)))
+            data.update(
+                extract_datasets_from_h5_group(value, prefix + (key,), file_map)
+            )
         elif isinstance(value, h5py.Dataset):
-            if value.shape == ():
-                data[prefix + (key,)] = [value[()]]
-            else:
-                data[prefix + (key,)] = value[:]
+            data[prefix + (key,)] = read_dataset(value, file_map)
 
     return data
 
@@ -88,115 +120,343 @@ def export_csv(df, label, filename):
     )
 
 
-def read_results_from_h5(path_h5):
+def process_k_means(d: dict, column_names, k_means_specs, time_specs=None, dtype=None):
+    """
+    Expands clustered time series to the full time horizon and writes them to a
+    dataframe with a time index
+
+    All time series are written to one contiguous array. The clustered time series
+    of each period are expanded together with a single gather over the k-means
+    sequence of the period, the other time series are written as they are.
+
+    :param dict d: dict of time series with column tuples as keys
+    :param list column_names: names of the column levels
+    :param dict k_means_specs: k-means specifications of the results file
+    :param dict time_specs: start and resolution of the time horizon (see
+        read_time_specs)
+    :param dtype: dtype of the values, by default the common dtype of the time series
+    :return: dataframe containing all time series
     """
-    Reads the energybalance, technology operation, design and network operation, design into a dict
+    keys = list(d)
+    columns = pd.MultiIndex.from_tuples(keys, names=column_names)
+    if not keys:
+        return pd.DataFrame(columns=columns)
+
+    # Positions of the clustered time series per period
+    clustered = {}
+    if k_means_specs:
+        for period in dict.fromkeys(key[0] for key in keys):
+            seq = k_means_specs[(period, "sequence")] - 1
+            clustered[period] = (seq, seq.max() + 1, [])
+        for position, key in enumerate(keys):
+            seq, n_clustered, positions = clustered[key[0]]
+            if len(d[key]) == n_clustered:
+                positions.append(position)
+        num_rows = len(next(iter(clustered.values()))[0])
+    else:
+        num_rows = len(d[keys[0]])
+
+    if dtype is None:
+        dtype = np.result_type(*{np.asarray(d[key]).dtype for key in keys})
+    values = np.empty((len(keys), num_rows), dtype=dtype)
+
+    is_clustered = np.zeros(len(keys), dtype=bool)
+    for seq, n_clustered, positions in clustered.values():
+        if not positions:
+            continue
+        is_clustered[positions] = True
+        block = np.stack([d[keys[position]] for position in positions])
+        if positions[-1] - positions[0] == len(positions) - 1:
+            np.take(block, seq, axis=1, out=values[positions[0] : positions[-1] + 1])
+        else:
+            values[positions] = block[:, seq]
+
+    for position in np.flatnonzero(~is_clustered):
+        values[position] = d[keys[position]]
+
+    # pandas stores the values of a dataframe as (columns, rows), so the transposed
+    # array is used without copying
+    df = pd.DataFrame(values.T, columns=columns, copy=False)
+    df = add_time_steps_to_df(df, **(time_specs or {}))
+
+    return df
+
+
+def load_result_in_process(data):
     """
+    Reads all sections of a h5 file on disk or of the contents of a h5 file in a
+    worker process
+
+    File contents are not sent back to the main process, so the file has to be set
+    as path_h5 of the returned result before sections can be read lazily.
 
-    def process_k_means(d: dict, column_names, k_means_specs):
+    :param data: path or contents (bytes) of the h5 file
+    :return: loaded result
+    """
+    if isinstance(data, bytes):
+        data = io.BytesIO(data)
+    result = LazyResult(data)
+    result.load_all()
+    result.path_h5 = None
 
-        data = {}
-        if k_means_specs:
+    return result
 
-            for key in d:
-                period = key[0]
-                seq = k_means_specs[(period, "sequence")]
-                n_clustered = max(seq)
 
-                if len(d[key]) == n_clustered:
-                    data[key] = d[key][seq - 1]
-                else:
-                    data[key] = d[key]
+def load_results_in_parallel(files, read_all, progress=None):
+    """
+    Loads several h5 files, reading them completely in a process pool if read_all
+    is True and there are several files and CPUs
+
+    Otherwise, the files are opened in the main process, which only reads their
+    topology, and with read_all they are loaded completely in the background (see
+    LazyResult.load_in_background), so that this returns right away. Identical
+    topologies and indexes of the loaded results are shared afterwards.
+
+    :param dict files: name and file object (path or uploaded file) of each result
+    :param bool read_all: reads all sections if True
+    :param progress: optional function called with the name of a result, a
+        percentage and a text once a result is opened or loaded in a worker process
+    :return: dict of results with the same names as files
+    """
+    results = {}
+    max_workers = min(len(files), os.cpu_count() or 1)
+    if max_workers <= 1 or not read_all:
+        for name, file in files.items():
+            start = time.perf_counter()
+            results[name] = LazyResult(file)
+            if progress:
+                duration = time.perf_counter() - start
+                progress(name, 100, f"Opened {name} in {duration:.1f} s")
+        share_structures(results.values())
+        if read_all:
+            for result in results.values():
+                result.load_in_background()
+        return results
+
+    # Worker processes are spawned, as forking the threaded streamlit server is
+    # not safe
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = {}
+        for name, file in files.items():
+            # Files on disk are opened in place by the workers
+            if not isinstance(file, (str, os.PathLike)):
+                file = file.getvalue()
+            futures[executor.submit(load_result_in_process, file)] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            results[name].path_h5 = files[name]
+            for section in OPERATION_SECTIONS:
+                if results[name].is_loaded(section):
+                    results[name].aggregates[section] = aggregate_time_levels(
+                        results[name][section]
+                    )
+            results[name].last_access = time.monotonic()
+            result_memory.register(results[name])
+            if progress:
+                duration = time.perf_counter() - start
+                progress(name, 100, f"Loaded {name} in {duration:.1f} s")
+
+    share_structures(results.values())
+    result_memory.enforce()
+
+    return {name: results[name] for name in files}
+
+
+def share_structures(results):
+    """
+    Lets results use the same objects for identical topologies, time indexes and
+    column indexes, so that scenarios of the same system do not hold copies of them
+
+    :param results: loaded results
+    """
+    topologies = []
+    columns = {section: [] for section in OPERATION_SECTIONS}
+    for result in results:
+        for topology in topologies:
+            if topology == result["topology"]:
+                result["topology"] = topology
+                break
         else:
-            for key in d:
-                data[key] = d[key]
-
-        df = pd.DataFrame(data)
-        df = df.rename_axis(columns=column_names)
-        df = add_time_steps_to_df(df)
-
-        return df
-
-    res = {}
-    res["topology"] = read_topology(path_h5)
-    res["k_means_specs"] = read_k_means_specs(path_h5)
-    res["summary"] = read_summary(path_h5)
-    loading_data_bar = st.progress(0, text="Loading energy balance")
-    ebalance = read_energy_balance(path_h5)
-    res["energybalance"] = process_k_means(
-        ebalance, ["Period", "Node", "Carrier", "Variable"], res["k_means_specs"]
-    )
-    loading_data_bar.progress(20, text="Loading technology operation")
-    technology_operation = read_technology_operation(path_h5)
-    res["technology_operation"] = process_k_means(
-        technology_operation,
-        ["Period", "Node", "Technology", "Variable"],
-        res["k_means_specs"],
-    )
-    loading_data_bar.progress(60, text="Loading technology design")
-    res["technology_design"] = read_technology_design(path_h5)
-    loading_data_bar.progress(80, text="Loading network operation and design")
-    res["network_design"], network_operation = read_networks(path_h5)
-    if network_operation:
-        res["network_operation"] = process_k_means(
-            network_operation,
-            ["Period", "Network", "Arc_ID", "Variable", "FromNode", "ToNode"],
-            res["k_means_specs"],
-        )
-    loading_data_bar.progress(100, text="Done")
+            topologies.append(result["topology"])
+
+        for section in OPERATION_SECTIONS:
+            if not result.is_loaded(section):
+                continue
+            data = result[section]
+            data.index = build_time_index(len(data), **result.time_specs)
+            for shared_columns in columns[section]:
+                if data.columns.equals(shared_columns):
+                    data.columns = shared_columns
+                    break
+            else:
+                columns[section].append(data.columns)
+            for aggregate in result.aggregates[section].values():
+                if aggregate.columns.equals(data.columns):
+                    aggregate.columns = data.columns
+
 
-    return res
+# python-calamine reads xlsx files much faster than openpyxl, but is optional
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
 
 
-def read_summary(path_h5):
+def read_summary(file):
     """
-    Reads summary
+    Reads a summary file (xlsx, csv or parquet) into a dataframe
+
+    The parsed frame is stored in the disk cache under the hash of the file, so that
+    loading the same file again only reads the cache.
+
+    :param file: path or file object (e.g. an uploaded file) of the summary
+    :return: dataframe with one row per run
     """
-    with h5py.File(path_h5, "r") as hdf_file:
-        summary = extract_datasets_from_h5_group(hdf_file["summary"])
+    file_hash = hash_file(file)
+    data = read_cached_section(file_hash, "summary")
+    if data is not None:
+        return data
+
+    suffix = Path(file if isinstance(file, (str, Path)) else file.name).suffix
+    suffix = suffix.lower()
+    if suffix == ".csv":
+        data = pd.read_csv(file, engine="pyarrow")
+    elif suffix == ".parquet":
+        data = pd.read_parquet(file)
+    else:
+        data = pd.read_excel(file, engine=EXCEL_ENGINE)
+    write_cached_section(file_hash, "summary", data)
 
-    df_summary = pd.DataFrame(summary)
+    return data
 
-    return df_summary
 
+def read_h5_sections(hdf_file, sections, progress=None, file_map=None):
+    """
+    Reads the datasets of several sections, visiting only the groups of the sections
 
-def read_energy_balance(path_h5):
+    :param hdf_file: opened h5 file
+    :param list sections: sections to read, keys of H5_SECTIONS
+    :param progress: optional function called with the number of bytes read so far
+        after each dataset
+    :param file_map: memory map of the h5 file (see read_dataset)
+    :return: dict with the datasets of each section (keys as in
+        extract_datasets_from_h5_group) and dict with the number of bytes read for
+        each section
     """
-    Reads energybalance
+    data = {section: {} for section in sections}
+    num_bytes = {section: 0 for section in sections}
+
+    for section in sections:
+        if H5_SECTIONS[section] not in hdf_file:
+            continue
+
+        def visit_dataset(name, value, section=section):
+            if not isinstance(value, h5py.Dataset):
+                return
+            data[section][tuple(name.split("/"))] = read_dataset(value, file_map)
+            num_bytes[section] += value.nbytes
+            if progress:
+                progress(sum(num_bytes.values()))
+
+        hdf_file[H5_SECTIONS[section]].visititems(visit_dataset)
+
+    return data, num_bytes
+
+
+def count_bytes(data):
     """
-    with h5py.File(path_h5, "r") as hdf_file:
-        bal = extract_datasets_from_h5_group(hdf_file["operation/energy_balance"])
+    Counts the bytes of all datasets read from a h5 group
 
-    return bal
+    :param dict data: datasets as returned by extract_datasets_from_h5_group
+    :return: number of bytes
+    """
+    return sum(np.asarray(value).nbytes for value in data.values())
 
 
-def read_technology_operation(path_h5):
+def index_results_dir(results_dir=RESULTS_DIR):
     """
-    Reads technology operation
+    Lists the h5 files in a directory and its subdirectories
+
+    :param results_dir: directory with result files
+    :return: dataframe with path, size and modification time of each file, indexed
+        by the file name relative to the directory and sorted by modification time
     """
-    with h5py.File(path_h5, "r") as hdf_file:
-        ope = extract_datasets_from_h5_group(hdf_file["operation/technology_operation"])
-    return ope
+    records = []
+    for path in Path(results_dir).rglob("*.h5"):
+        stat = path.stat()
+        records.append(
+            {
+                "Name": str(path.relative_to(results_dir).with_suffix("")),
+                "Path": str(path),
+                "Size [MB]": round(stat.st_size / 1e6, 1),
+                "Modified": pd.Timestamp(stat.st_mtime, unit="s").floor("s"),
+            }
+        )
+    if not records:
+        return pd.DataFrame(columns=["Path", "Size [MB]", "Modified"])
+
+    return (
+        pd.DataFrame(records).set_index("Name").sort_values("Modified", ascending=False)
+    )
+
 
+def read_time_specs(hdf_file):
+    """
+    Reads start and resolution of the time horizon from the time stamps in the
+    topology, if the results file contains them
 
-def read_technology_design(path_h5):
+    :param hdf_file: opened h5 file
+    :return: dict with start and resolution
     """
-    Reads technology design
+    if "topology/time_stamps" not in hdf_file:
+        return {"start": DEFAULT_START, "resolution": DEFAULT_RESOLUTION}
+
+    time_stamps = pd.to_datetime(
+        extract_data_from_h5_dataset(hdf_file["topology/time_stamps"][:2])
+    )
+    if len(time_stamps) < 2:
+        resolution = DEFAULT_RESOLUTION
+    else:
+        resolution = str(time_stamps[1] - time_stamps[0])
+
+    return {"start": str(time_stamps[0]), "resolution": resolution}
+
+
+def format_technology_design(technology_design):
     """
-    with h5py.File(path_h5, "r") as hdf_file:
-        technology_design = extract_datasets_from_h5_group(hdf_file["design/nodes"])
+    Writes the technology design to a long dataframe
 
+    :param dict technology_design: datasets of the design/nodes group
+    :return: dataframe with columns Period, Node, Technology, Variable, Value and
+        Text
+    """
     technology_design = pd.DataFrame(technology_design)
     technology_design = pd.melt(technology_design)
     technology_design.columns = ["Period", "Node", "Technology", "Variable", "Value"]
 
+    # Text values, e.g. the technology type, are kept in a separate column, so that
+    # both columns have a single type
+    values = technology_design["Value"]
+    is_text = values.map(lambda value: isinstance(value, (bytes, str)))
+    text = values[is_text].map(
+        lambda value: value.decode("utf-8") if isinstance(value, bytes) else value
+    )
+    technology_design["Value"] = pd.to_numeric(values.mask(is_text))
+    technology_design["Text"] = text.reindex(values.index).astype("string")
+
     return technology_design
 
 
-def read_networks(path_h5):
-    with h5py.File(path_h5, "r") as hdf_file:
-        network_design = extract_datasets_from_h5_group(hdf_file["design/networks"])
+def format_network_design(network_design):
+    """
+    Writes the network design to a dataframe with one row per arc and period
 
+    :param dict network_design: datasets of the design/networks group
+    :return: dataframe of the network design
+    """
     network_design = pd.DataFrame(network_design)
     if not network_design.empty:
         network_design = network_design.melt()
@@ -207,54 +467,842 @@ def read_networks(path_h5):
         network_design["FromNode"] = network_design["fromNode"].str.decode("utf-8")
         network_design["ToNode"] = network_design["toNode"].str.decode("utf-8")
         network_design.drop(columns=["fromNode", "toNode", "network"], inplace=True)
-        network_design = network_design.reset_index()
-        arc_ids = network_design[["Arc_ID", "FromNode", "ToNode"]]
+        network_design = network_design.reset_index().infer_objects()
+
+    return network_design
+
+
+def format_network_operation(network_operation, network_design):
+    """
+    Adds the from and to nodes of each arc to the keys of the network operation
+
+    The time series are not copied; process_k_means writes them to a single array
+    afterwards. Arcs that are not in the network design are left out.
+
+    :param dict network_operation: datasets of the operation/networks group
+    :param pd.DataFrame network_design: formatted network design
+    :return: dict of time series with keys (Period, Network, Arc_ID, Variable,
+        FromNode, ToNode)
+    """
+    if not network_operation:
+        return {}
+
+    # The ends of an arc are taken from its first entry in the design
+    arcs = network_design.drop_duplicates(subset=["Arc_ID"])
+    arc_ends = dict(zip(arcs["Arc_ID"], zip(arcs["FromNode"], arcs["ToNode"])))
+
+    return {
+        key + arc_ends[key[2]]: values
+        for key, values in network_operation.items()
+        if key[2] in arc_ends
+    }
+
+
+OPERATION_SECTIONS = {
+    "energybalance": (
+        "operation/energy_balance",
+        ["Period", "Node", "Carrier", "Variable"],
+    ),
+    "technology_operation": (
+        "operation/technology_operation",
+        ["Period", "Node", "Technology", "Variable"],
+    ),
+    "network_operation": (
+        "operation/networks",
+        ["Period", "Network", "Arc_ID", "Variable", "FromNode", "ToNode"],
+    ),
+}
+
+# Groups of all sections that are read from the h5 file on demand. The network
+# design is placed before the network operation, as the latter needs the arcs.
+H5_SECTIONS = {
+    "technology_design": "design/nodes",
+    "network_design": "design/networks",
+    "energybalance": "operation/energy_balance",
+    "technology_operation": "operation/technology_operation",
+    "network_operation": "operation/networks",
+}
+
+# Threads of load_in_background. They are waited for on exit, as h5py closes all
+# files on exit and reads of a closed file can hang.
+background_loaders = weakref.WeakSet()
+
+
+@atexit.register
+def wait_for_background_loaders():
+    """
+    Waits until all sections that are loading in the background are stored
+    """
+    for loader in list(background_loaders):
+        loader.join()
+
+
+# Order in which sections are loaded in the background, the sections that are
+# usually looked at first come first
+LOAD_PRIORITY = [
+    "energybalance",
+    "technology_design",
+    "technology_operation",
+    "network_design",
+    "network_operation",
+]
+
+
+class LazyResult(dict):
+    """
+    Results of a single h5 file that are only read when they are needed
+
+    On creation, only the topology, the k-means specs and the summary are read.
+    Files on disk and uploaded files are not copied: contiguous datasets are read
+    from a memory map of the file (see read_dataset).
+    Slices of the operation sections are read with select, complete sections are
+    read the first time they are accessed as an item, e.g. result["energybalance"],
+    or all at once with load_all, which stores the sections in LOAD_PRIORITY order.
+    load_in_background runs load_all in a background thread; each section can be
+    used as soon as it is stored. A section is only loaded by one thread at a time,
+    other threads that access it wait until it is stored.
+    Wall time, bytes read and peak memory of each
+    reading and processing stage are kept in profile (see profile_stage).
+
+    For the operation sections, sums and means over all time levels are computed
+    once when the section is loaded and kept in aggregates, so that aggregate only
+    looks them up. The positions of the columns below each selection of keys are
+    kept in selections (see build_selection_index), so that selections of loaded
+    sections are views found with a single lookup.
+
+    Processed sections are stored in the disk cache under the id of the file
+    (result_id, see hash_file), so that loading the same file again only reads the
+    cache. Loaded sections count towards the memory budget shared by all sessions
+    (see MemoryBudget); sections evicted from idle results are read again from the
+    disk cache when they are used.
+    """
 
-    with h5py.File(path_h5, "r") as hdf_file:
-        network_operation = extract_datasets_from_h5_group(
-            hdf_file["operation/networks"]
+    def __init__(self, path_h5):
+        super().__init__()
+        self.path_h5 = path_h5
+        self._result_id = None
+        self.profile = deque(maxlen=PROFILE_SIZE)
+        self.cache_status = {}
+        self.aggregates = {}
+        self.selections = {}
+        self.evicted = set()
+        self.last_access = time.monotonic()
+        self.pending = []
+        self._hdf_file = None
+        self._file_map = None
+        self._loader = None
+        self._close_when_loaded = False
+        self._create_locks()
+
+        hdf_file = self.hdf_file
+        self["topology"] = {
+            "nodes": extract_data_from_h5_dataset(hdf_file["topology/nodes"]),
+            "carriers": extract_data_from_h5_dataset(hdf_file["topology/carriers"]),
+            "periods": extract_data_from_h5_dataset(hdf_file["topology/periods"]),
+        }
+        # Read by h5py, as the specs are kept as long as the result
+        self["k_means_specs"] = extract_datasets_from_h5_group(
+            hdf_file["k_means_specs"]
+        )
+        self["summary"] = pd.DataFrame(
+            extract_datasets_from_h5_group(hdf_file["summary"])
         )
-        # st.text(network_operation)
+        self.time_specs = read_time_specs(hdf_file)
+        # Values of the operation sections, float32 in compact mode
+        self.dtype = np.float32 if COMPACT_RESULTS else None
+
+    def __getstate__(self):
+        """
+        Drops the open h5 file, its memory map and the time aggregates when the
+        result is sent to another process
+        """
+        state = self.__dict__.copy()
+        state["_hdf_file"] = None
+        state["_file_map"] = None
+        state["_loader"] = None
+        del state["_lock"], state["_section_locks"]
+        # The aggregates are computed again after unpickling, as some of them are
+        # views of the sections, which pickling would turn into copies
+        state["aggregates"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_locks()
+
+    def _create_locks(self):
+        """
+        Creates the locks of the pending sections and of each section, which are
+        held while the section is loaded
+        """
+        self._lock = threading.Lock()
+        self._section_locks = {section: threading.RLock() for section in H5_SECTIONS}
+
+    @property
+    def result_id(self):
+        """
+        Id of the file in the caches, computed when it is first needed, as uploaded
+        files are hashed completely
+        """
+        if self._result_id is None:
+            self._result_id = hash_file(self.path_h5)
+        return self._result_id
+
+    @result_id.setter
+    def result_id(self, result_id):
+        self._result_id = result_id
+
+    def close(self):
+        """
+        Closes the h5 file and its memory map
+
+        Arrays that are still views of the memory map keep it open until they are
+        garbage collected. The file is opened again if the result is used afterwards.
+        While the result is loading in the background, the file is closed once it is
+        loaded.
+        """
+        loader = self._loader
+        if loader is not None and loader.is_alive():
+            if loader is not threading.current_thread():
+                self._close_when_loaded = True
+                return
+        if self._hdf_file is not None:
+            self._hdf_file.close()
+            self._hdf_file = None
+        if self._file_map is not None:
+            try:
+                if isinstance(self._file_map, mmap.mmap):
+                    self._file_map.close()
+                else:
+                    self._file_map.release()
+            except BufferError:
+                pass
+            self._file_map = None
+
+    def _profile(self, stage, section=None):
+        """
+        Measures a stage of reading or processing this result
+        """
+        return profile_stage(self.profile, stage, section, result=self._result_id)
+
+    @property
+    def hdf_file(self):
+        """
+        h5 file of the result, opened once and kept open for later reads
+        """
+        if self._hdf_file is None:
+            self._hdf_file = h5py.File(self.path_h5, "r")
+        return self._hdf_file
+
+    @property
+    def file_map(self):
+        """
+        Memory map of the h5 file if it is a file on disk, or the buffer of an
+        in-memory file (e.g. an uploaded file), or None
+
+        The file must not be changed while the result is open.
+        """
+        if self._file_map is None:
+            if isinstance(self.path_h5, (str, os.PathLike)):
+                with open(self.path_h5, "rb") as file:
+                    self._file_map = mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            elif isinstance(self.path_h5, io.BytesIO):
+                self._file_map = self.path_h5.getbuffer()
+        return self._file_map
+
+    def __missing__(self, key):
+        """
+        Reads a complete section from the h5 file, or waits until it is stored if
+        another thread is loading it
+        """
+        if key not in H5_SECTIONS:
+            raise KeyError(key)
+        # The network operation needs the network design. Locks are always taken in
+        # the order of H5_SECTIONS, as in load_all.
+        with contextlib.ExitStack() as stack:
+            if key == "network_operation":
+                stack.enter_context(self._section_locks["network_design"])
+            stack.enter_context(self._section_locks[key])
+            if self.is_loaded(key):
+                return self[key]
+            if self._read_from_cache(key):
+                return self[key]
+
+            with self._profile("Reading", key) as record:
+                data = extract_datasets_from_h5_group(
+                    self.hdf_file[H5_SECTIONS[key]], file_map=self.file_map
+                )
+                record["Bytes read"] = count_bytes(data)
+            self._add_section(key, data, record["Bytes read"])
+
+            return self[key]
+
+    def _add_section(self, section, data, num_bytes):
+        """
+        Formats the datasets of a section and stores them in the result
+
+        :param str section: name of the section
+        :param dict data: datasets of the section
+        :param int num_bytes: number of bytes of the datasets
+        """
+        start = time.perf_counter()
+        if section in OPERATION_SECTIONS:
+            column_names = OPERATION_SECTIONS[section][1]
+            if section == "network_operation":
+                network_design = self["network_design"]
+                with self._profile("Formatting", section):
+                    data = format_network_operation(data, network_design)
+            if not data:
+                raise KeyError(section)
+            with self._profile("Expanding", section):
+                data = process_k_means(
+                    data,
+                    column_names,
+                    self["k_means_specs"],
+                    self.time_specs,
+                    self.dtype,
+                )
+        elif section == "technology_design":
+            with self._profile("Formatting", section):
+                data = format_technology_design(data)
+        elif section == "network_design":
+            with self._profile("Formatting", section):
+                data = format_network_design(data)
+        if COMPACT_RESULTS and section not in OPERATION_SECTIONS:
+            data = compact_frame(data)
+
+        self._store_section(section, data)
+        with self._profile("Cache writing", section):
+            write_cached_section(self.result_id, section, self[section])
+        self.cache_status[section] = "miss"
+        update_rate("Processing", section, num_bytes, time.perf_counter() - start)
+
+    def _read_from_cache(self, section):
+        """
+        Reads a processed section from the disk cache
+
+        :param str section: name of the section
+        :return: True if the section was cached
+        """
+        path = cached_section_path(self.result_id, section)
+        if path is None:
+            return False
+        with self._profile("Cache reading", section) as record:
+            data = read_cached_section(self.result_id, section)
+            record["Bytes read"] = path.stat().st_size if data is not None else 0
+        if data is None:
+            return False
+
+        self._store_section(section, data)
+        self.cache_status[section] = "hit"
+        return True
+
+    def _store_section(self, section, data):
+        """
+        Stores a processed section and computes its time aggregates
+        """
+        if section in OPERATION_SECTIONS:
+            # Share one time index object among all sections
+            data.index = build_time_index(len(data), **self.time_specs)
+        self[section] = data
+        if section in OPERATION_SECTIONS:
+            with self._profile("Indexing", section):
+                self.selections[section] = build_selection_index(data.columns)
+            with self._profile("Aggregating", section):
+                self.aggregates[section] = aggregate_time_levels(data)
+        self.evicted.discard(section)
+        self.last_access = time.monotonic()
+        result_memory.register(self)
+        result_memory.enforce(keep=self)
+
+    def section_sizes(self):
+        """
+        Computes the in-memory size of each loaded section, including its time
+        aggregates
+
+        Aggregates that are views of the values of the section, e.g. the hourly
+        sums of hourly data, are not counted again.
+
+        :return: dict with the size in bytes of each section
+        """
+        sizes = {}
+        for section in H5_SECTIONS:
+            data = self.get(section)
+            if data is None:
+                continue
+            if section in OPERATION_SECTIONS:
+                sizes[section] = frame_size(data) - data.index.memory_usage()
+                values = data.to_numpy()
+            else:
+                # Design sections hold strings, whose size is only counted with deep
+                sizes[section] = int(data.memory_usage(index=False, deep=True).sum())
+            for aggregate in self.aggregates.get(section, {}).values():
+                if not np.may_share_memory(aggregate.to_numpy(), values):
+                    sizes[section] += frame_size(aggregate)
+
+        return sizes
+
+    def drop(self, section, evicted=False):
+        """
+        Removes a loaded section from memory
+
+        The section is read again from the disk cache or the h5 file when it is
+        used. Sections evicted to keep the memory budget are loaded completely
+        again when they are used, other sections are read in slices.
+
+        Sections that another thread holds, e.g. while loading a section that needs
+        them, are not dropped.
+
+        :param str section: name of the section
+        :param bool evicted: True if the section is dropped to keep the memory budget
+        :return: True if the section was dropped
+        """
+        lock = self._section_locks[section]
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            self.pop(section, None)
+            self.aggregates.pop(section, None)
+            self.selections.pop(section, None)
+            aggregation_cache.clear(self.result_id)
+            if evicted:
+                self.evicted.add(section)
+        finally:
+            lock.release()
+        return True
+
+    def _restore(self, section):
+        """
+        Reloads a section that was evicted to keep the memory budget and marks the
+        result as used
+        """
+        self.last_access = time.monotonic()
+        if section in self.evicted:
+            self[section]
+
+    def load_all(self, progress=None):
+        """
+        Reads all sections that are not loaded yet with the h5 file opened once,
+        visiting only their groups, and stores them in LOAD_PRIORITY order
+
+        The sections are held from the start, so that other threads wait for them
+        instead of reading them again. Each section is released as soon as it is
+        stored. The progress is estimated from the bytes read and processed so far
+        and the time per byte measured for each stage and section in earlier loads.
+
+        :param progress: optional function called with a percentage and a text
+            whenever the percentage changes
+        """
+        # The network design is held as long as the network operation, which needs
+        # it, as in __missing__. Locks are taken in the order of H5_SECTIONS.
+        design_lock = None
+        locks = {}
+        for section in H5_SECTIONS:
+            if section == "network_design" and not self.is_loaded("network_operation"):
+                design_lock = self._section_locks[section]
+                design_lock.acquire()
+            if not self.is_loaded(section):
+                locks[section] = self._section_locks[section]
+                locks[section].acquire()
+
+        def release(section):
+            nonlocal design_lock
+            locks.pop(section).release()
+            if section == "network_operation" and design_lock is not None:
+                design_lock.release()
+                design_lock = None
+            with self._lock:
+                if section in self.pending:
+                    self.pending.remove(section)
+
+        try:
+            sections = []
+            for section in LOAD_PRIORITY:
+                if section not in locks:
+                    continue
+                if self.is_loaded(section) or self._read_from_cache(section):
+                    release(section)
+                else:
+                    sections.append(section)
+            if not sections:
+                return
+
+            shown = set()
+
+            def report(fraction, text):
+                percentage = int(100 * min(fraction, 1))
+                if progress and percentage not in shown:
+                    shown.add(percentage)
+                    progress(percentage, text)
+
+            total_bytes = self.hdf_file.id.get_filesize()
+            expected_reading = estimate_duration("Reading", None, total_bytes)
+            reading_share = expected_reading / (
+                expected_reading + estimate_duration("Processing", None, total_bytes)
+            )
+
+            report(0, "Reading h5 file")
+            with self._profile("Reading") as record:
+                data, num_bytes = read_h5_sections(
+                    self.hdf_file,
+                    sections,
+                    lambda bytes_read: report(
+                        reading_share * bytes_read / total_bytes, "Reading h5 file"
+                    ),
+                    self.file_map,
+                )
+                record["Bytes read"] = sum(num_bytes.values())
+            update_rate("Reading", None, record["Bytes read"], record["Wall time [s]"])
+
+            expected = {
+                section: estimate_duration("Processing", section, num_bytes[section])
+                for section in sections
+            }
+            done = 0
+            for section in sections:
+                report(
+                    reading_share
+                    + (1 - reading_share) * done / (sum(expected.values()) or 1),
+                    "Processing " + section,
+                )
+                try:
+                    self._add_section(section, data.pop(section), num_bytes[section])
+                except KeyError:
+                    pass
+                release(section)
+                done += expected[section]
+        finally:
+            for section in list(locks):
+                release(section)
+            if design_lock is not None:
+                design_lock.release()
+
+    def load_in_background(self):
+        """
+        Runs load_all in a background thread and returns immediately
+
+        The sections are stored one by one in LOAD_PRIORITY order and can be used
+        as soon as they are stored. Does nothing if the result is already loading
+        in the background.
+        """
+        if self._loader is not None and self._loader.is_alive():
+            return
+        with self._lock:
+            self.pending = [
+                section for section in LOAD_PRIORITY if not self.is_loaded(section)
+            ]
+            if not self.pending:
+                return
+
+        def load():
+            try:
+                self.load_all()
+            finally:
+                with self._lock:
+                    self.pending = []
+                if self._close_when_loaded:
+                    self._close_when_loaded = False
+                    self.close()
+
+        self._loader = threading.Thread(target=load, daemon=True)
+        self._loader.start()
+        background_loaders.add(self._loader)
+
+    def is_loading(self, section):
+        """
+        Checks if a section is waiting to be loaded or being loaded in the background
+
+        :param str section: name of the section
+        :return: True if the section is not loaded yet but will be
+        """
+        return section in self.pending
 
-    if network_operation:
-        network_operation = pd.DataFrame(network_operation)
+    def is_loaded(self, section):
+        """
+        Checks if a complete section is held in memory
 
-        network_operation.columns.names = ["Period", "Network", "Arc_ID", "Variable"]
+        :param str section: name of the section
+        :return: True if the section has been read completely
+        """
+        return section in self
 
-        network_operation = network_operation.T.reset_index()
-        network_operation = pd.merge(
-            network_operation,
-            arc_ids.drop_duplicates(subset=["Arc_ID"]),
-            how="inner",
-            left_on="Arc_ID",
-            right_on="Arc_ID",
+    def select(self, section, *keys):
+        """
+        Returns the hourly data of an operation section below the given keys
+
+        Only the datasets below the keys are read from the h5 file, unless the
+        section is already loaded completely.
+
+        :param str section: energybalance, technology_operation or network_operation
+        :param keys: keys of the column levels, e.g. (period, node, carrier)
+        :return: dataframe with all columns below keys
+        """
+        group_path, column_names = OPERATION_SECTIONS[section]
+        self._restore(section)
+
+        data = self.get(section)
+        selection_index = self.selections.get(section)
+        if data is not None and selection_index is not None:
+            return data.iloc[:, selection_index[keys][0]]
+
+        with self._profile("Reading slice", section) as record:
+            group = self.hdf_file["/".join((group_path,) + keys)]
+            data = extract_datasets_from_h5_group(group, keys, self.file_map)
+            record["Bytes read"] = count_bytes(data)
+        if section == "network_operation":
+            data = format_network_operation(data, self["network_design"])
+
+        with self._profile("Expanding slice", section):
+            return process_k_means(
+                data, column_names, self["k_means_specs"], self.time_specs, self.dtype
+            )
+
+    def aggregate(self, section, *keys, level="Hour", aggregation="sum"):
+        """
+        Returns the data of an operation section below the given keys aggregated
+        to a time level
+
+        If the section is loaded completely, the precomputed aggregates are used.
+        Otherwise, the selected slice is aggregated. The result is kept in the
+        aggregation cache under the selection and must not be modified.
+
+        :param str section: energybalance, technology_operation or network_operation
+        :param keys: keys of the column levels, e.g. (period, node, carrier)
+        :param str level: Year, Month, Week, Day or Hour
+        :param str aggregation: sum or mean
+        :return: dataframe with all columns below keys and a Timeslice index
+        """
+
+        def compute():
+            # The aggregates are looked up once, as another session can evict them
+            aggregates = self.aggregates.get(section)
+            selection_index = self.selections.get(section)
+            if aggregates is None or selection_index is None:
+                data = self.select(section, *keys)
+                with self._profile("Aggregating slice", section):
+                    return aggregate_time(data, level, aggregation)
+
+            data = aggregates[(level, aggregation)]
+            return data.iloc[:, selection_index[keys][0]]
+
+        self._restore(section)
+        return aggregation_cache.get_or_compute(
+            (self.result_id, section, keys, level, aggregation), compute
         )
-        network_operation = network_operation.set_index(
-            ["Period", "Network", "Arc_ID", "Variable", "FromNode", "ToNode"]
-        ).T
-
-        network_operation = network_operation.to_dict(orient="list")
-        ope = {}
-        for key in network_operation:
-            ope[key] = np.array(network_operation[key])
-    else:
-        ope = {}
 
-    return network_design, ope
+    def list_items(self, section, *keys):
+        """
+        Lists the entries of the next column level below the given keys, e.g.
+        all technologies at a node
+
+        :param str section: energybalance, technology_operation or network_operation
+        :param keys: keys of the column levels, e.g. (period, node)
+        :return: list of entries
+        """
+        group_path, column_names = OPERATION_SECTIONS[section]
+        self._restore(section)
+
+        selection_index = self.selections.get(section)
+        if selection_index is not None:
+            return list(selection_index.get(keys, (None, []))[1])
+
+        group_path = "/".join((group_path,) + keys)
+        if group_path not in self.hdf_file:
+            return []
+        return list(self.hdf_file[group_path].keys())
+
+
+def compare_results(base, other, section, *keys, level="Hour", aggregation="sum"):
+    """
+    Returns the absolute and relative differences between two results for the data
+    of an operation section below the given keys aggregated to a time level
+
+    Keys that exist in only one of the results are compared to zero. The result is
+    kept in the aggregation cache under the pair of results and the selection and
+    must not be modified.
+
+    :param LazyResult base: result the differences refer to
+    :param LazyResult other: compared result
+    :param str section: energybalance, technology_operation or network_operation
+    :param keys: keys of the column levels, e.g. (period, node, carrier)
+    :param str level: Year, Month, Week, Day or Hour
+    :param str aggregation: sum or mean
+    :return: dataframe with an additional first column level Difference (Absolute,
+        Relative)
+    """
+
+    def aggregate(result):
+        try:
+            return result.aggregate(
+                section, *keys, level=level, aggregation=aggregation
+            )
+        except KeyError:
+            return None
+
+    def compute():
+        base_data = aggregate(base)
+        other_data = aggregate(other)
+        if base_data is None and other_data is None:
+            raise KeyError(keys)
+        if base_data is None:
+            base_data = other_data.iloc[:, :0]
+        if other_data is None:
+            other_data = base_data.iloc[:, :0]
+        return compute_difference(base_data, other_data)
+
+    key = (base.result_id, "difference", other.result_id)
+    return aggregation_cache.get_or_compute(
+        key + (section, keys, level, aggregation), compute
+    )
+
+
+class ResultHandle:
+    """
+    Reference of a session to a result in the ResultStore
+
+    The reference is released when release is called or when the handle is
+    garbage collected, e.g. when the session ends.
+    """
+
+    def __init__(self, store, result_id):
+        self.result_id = result_id
+        self._store = store
+        self._finalizer = weakref.finalize(self, store.release, result_id)
+
+    @property
+    def result(self):
+        """
+        Shared result, which must not be modified
+        """
+        return self._store.get(self.result_id)
+
+    def release(self):
+        """
+        Releases the reference to the result
+        """
+        self._finalizer()
+
+
+class ResultStore:
+    """
+    Results shared by all sessions, keyed by the id of the file (see hash_file)
+
+    Sessions that load the same file get a handle to the same result, so that the
+    file is only read and held once. Results are removed and their files closed
+    when the last handle to them is released.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._references = {}
+        # Events of the files that are being loaded, set when loading has ended
+        self._loading = {}
+        # Reentrant, as handles can be garbage collected while the store is held
+        self._lock = threading.RLock()
+
+    def load(self, files, read_all, progress=None):
+        """
+        Loads the files that are not in the store yet and returns handles to all of
+        them
+
+        The store is only held to look up and reserve files, not while they are
+        loaded. Files that another session is loading at the same time are waited
+        for, so that they are only loaded once.
+
+        :param dict files: name and file object (path or uploaded file) of each result
+        :param bool read_all: reads all sections if True
+        :param progress: optional function called with the name of a result, a
+            percentage and a text (see load_results_in_parallel)
+        :return: dict of handles with the same names as files
+        """
+        result_ids = {name: hash_file(file) for name, file in files.items()}
+        new_files = {}
+        waiting = {}
+        with self._lock:
+            for name, file in files.items():
+                result_id = result_ids[name]
+                if result_id in self._loading:
+                    waiting[name] = self._loading[result_id]
+                elif result_id not in self._results:
+                    self._loading[result_id] = threading.Event()
+                    new_files[name] = file
+
+        try:
+            results = load_results_in_parallel(new_files, read_all, progress)
+            with self._lock:
+                for name, result in results.items():
+                    result.result_id = result_ids[name]
+                    self._results[result.result_id] = result
+                    self._references[result.result_id] = 0
+        finally:
+            with self._lock:
+                for name in new_files:
+                    self._loading.pop(result_ids[name]).set()
+
+        for event in waiting.values():
+            event.wait()
+
+        handles = {}
+        with self._lock:
+            for name, result_id in result_ids.items():
+                if result_id in self._results:
+                    self._references[result_id] += 1
+                    handles[name] = ResultHandle(self, result_id)
+
+        # Files that failed to load in another session or were released meanwhile
+        missing = {name: file for name, file in files.items() if name not in handles}
+        if missing:
+            handles.update(self.load(missing, read_all, progress))
+
+        for name, handle in handles.items():
+            if name in new_files:
+                continue
+            if read_all:
+                handle.result.load_in_background()
+            if progress:
+                progress(name, 100, f"{name} is shared with other sessions")
+
+        return handles
+
+    def get(self, result_id):
+        """
+        Returns a result of the store
+
+        :param str result_id: id of the results file
+        :return: result
+        """
+        return self._results[result_id]
 
+    def count_references(self, result_id):
+        """
+        Counts the handles to a result
 
-def read_topology(path_h5):
+        :param str result_id: id of the results file
+        :return: number of handles
+        """
+        with self._lock:
+            return self._references.get(result_id, 0)
 
-    topology = {}
-    topology["nodes"] = load_nodes_from_h5_results(path_h5)
-    topology["carriers"] = load_carriers_from_h5_results(path_h5)
-    topology["periods"] = load_periods_from_h5_results(path_h5)
+    def release(self, result_id):
+        """
+        Releases a reference to a result and removes the result and closes its file
+        when it is no longer referenced
 
-    return topology
+        :param str result_id: id of the results file
+        """
+        with self._lock:
+            self._references[result_id] -= 1
+            if self._references[result_id] > 0:
+                return
+            del self._references[result_id]
+            result = self._results.pop(result_id)
+        aggregation_cache.clear(result_id)
+        result.close()
 
+    def __len__(self):
+        return len(self._results)
 
-def read_k_means_specs(path_h5):
-    with h5py.File(path_h5, "r") as hdf_file:
-        k_means_specs = extract_datasets_from_h5_group(hdf_file["k_means_specs"])
 
-    return k_means_specs
+result_store = ResultStore()
@@ -0,0 +1,322 @@
+import hashlib
+import os
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+# Location and maximal size of the cache of processed results. Both can be set with
+# environment variables.
+CACHE_DIR = Path(
+    os.environ.get(
+        "VISUALIZATION_CACHE_DIR", Path.home() / ".cache" / "adopt_visualization"
+    )
+)
+CACHE_SIZE = float(os.environ.get("VISUALIZATION_CACHE_SIZE_GB", 5)) * 1e9
+
+# Memory budget of the cache of aggregated slices shared by all sessions
+AGGREGATION_CACHE_SIZE = (
+    float(os.environ.get("VISUALIZATION_AGGREGATION_CACHE_MB", 500)) * 1e6
+)
+
+# Memory budget of the loaded sections of all results of all sessions. Sections of
+# the least recently used results are evicted beyond it and read again from the
+# disk cache when they are needed.
+RESULT_MEMORY_SIZE = float(os.environ.get("VISUALIZATION_RESULT_MEMORY_MB", 4000)) * 1e6
+
+# Stores values as float32 and labels as categoricals, which halves the memory of
+# loaded results at the cost of precision. Compact results are cached separately.
+COMPACT_RESULTS = os.environ.get("VISUALIZATION_COMPACT", "0") == "1"
+
+# Increase when the format of the processed results changes to invalidate old entries
+CACHE_VERSION = "3"
+
+CACHED_SECTIONS = [
+    "energybalance",
+    "technology_operation",
+    "technology_design",
+    "network_design",
+    "network_operation",
+    "summary",
+]
+
+
+def hash_file(path_h5, chunk_size=2**24):
+    """
+    Computes an id of a file for the cache
+
+    Files on disk are identified by their path, size and modification time, so that
+    they do not have to be read. File objects (e.g. uploaded files) are identified
+    by a hash of their contents.
+
+    :param path_h5: path or file object (e.g. an uploaded file)
+    :param int chunk_size: number of bytes read at once
+    :return: hex digest of the file and the storage mode
+    """
+    version = CACHE_VERSION + ("-compact" if COMPACT_RESULTS else "")
+    file_hash = hashlib.blake2b(version.encode(), digest_size=20)
+    if isinstance(path_h5, (str, os.PathLike)):
+        stat = os.stat(path_h5)
+        key = (os.path.realpath(path_h5), stat.st_size, stat.st_mtime_ns)
+        file_hash.update(repr(key).encode())
+        return file_hash.hexdigest()
+
+    position = path_h5.tell()
+    path_h5.seek(0)
+    while chunk := path_h5.read(chunk_size):
+        file_hash.update(chunk)
+    path_h5.seek(position)
+
+    return file_hash.hexdigest()
+
+
+def cached_section_path(file_hash, section):
+    """
+    Finds the file of a processed section in the cache
+
+    :param str file_hash: hash of the results file
+    :param str section: name of the section
+    :return: path of the cached file or None if the section is not cached
+    """
+    path = CACHE_DIR / file_hash / (section + ".parquet")
+    return path if path.exists() else None
+
+
+def read_cached_section(file_hash, section):
+    """
+    Reads a processed section of a result from the cache
+
+    Parquet files are memory mapped. Entries that cannot be read, e.g. truncated
+    files, are deleted.
+
+    :param str file_hash: hash of the results file
+    :param str section: name of the section
+    :return: dataframe or None if the section is not cached
+    """
+    path = cached_section_path(file_hash, section)
+    if path is None:
+        return None
+    try:
+        df = pd.read_parquet(path, memory_map=True)
+        os.utime(path.parent)
+    except Exception:
+        path.unlink(missing_ok=True)
+        return None
+
+    return df
+
+
+def write_cached_section(file_hash, section, df):
+    """
+    Writes a processed section of a result to the cache and evicts the least
+    recently used results if the cache exceeds its size
+
+    Sections that cannot be stored in parquet (e.g. columns of mixed types) are not
+    cached.
+
+    :param str file_hash: hash of the results file
+    :param str section: name of the section
+    :param pd.DataFrame df: processed section
+    """
+    entry = CACHE_DIR / file_hash
+    path = entry / (section + ".parquet")
+    try:
+        entry.mkdir(parents=True, exist_ok=True)
+        try:
+            df.to_parquet(path.with_suffix(".tmp"))
+        except (pa.ArrowException, TypeError, ValueError):
+            path.with_suffix(".tmp").unlink(missing_ok=True)
+            return
+        os.replace(path.with_suffix(".tmp"), path)
+        evict_cache(keep=file_hash)
+    except OSError:
+        pass
+
+
+def get_cache_size():
+    """
+    Computes the size of all cached results
+
+    :return: size in bytes
+    """
+    if not CACHE_DIR.exists():
+        return 0
+    return sum(file.stat().st_size for file in CACHE_DIR.rglob("*") if file.is_file())
+
+
+def evict_cache(max_size=CACHE_SIZE, keep=None):
+    """
+    Deletes the least recently used results until the cache is smaller than max_size
+
+    :param float max_size: maximal size of the cache in bytes
+    :param str keep: hash of a result that is not deleted
+    """
+    entries = [entry for entry in CACHE_DIR.iterdir() if entry.is_dir()]
+    sizes = {
+        entry: sum(file.stat().st_size for file in entry.iterdir()) for entry in entries
+    }
+    total_size = sum(sizes.values())
+
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total_size <= max_size:
+            break
+        if entry.name == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= sizes[entry]
+
+
+def frame_size(df):
+    """
+    Computes the size of the values and the index of a dataframe from its dtypes,
+    which is much faster than memory_usage for dataframes with many columns
+
+    Only the references of object values are counted, as by memory_usage.
+
+    :param pd.DataFrame df: dataframe
+    :return: size in bytes
+    """
+    row_size = sum(getattr(dtype, "itemsize", 8) for dtype in df.dtypes)
+    return row_size * len(df) + df.index.memory_usage()
+
+
+class SliceCache:
+    """
+    Least recently used cache of dataframes with a memory budget
+
+    Entries are keyed by the selection they were computed from, e.g. (result id,
+    section, keys, level, aggregation), so that looking them up does not require
+    hashing the data. Cached dataframes are shared and must not be modified.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached dataframe of key or computes and caches it
+
+        :param tuple key: key of the entry
+        :param compute: function without arguments that computes the dataframe
+        :return: dataframe
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        df = compute()
+        self.put(key, df)
+
+        return df
+
+    def put(self, key, df):
+        """
+        Adds a dataframe and evicts the least recently used entries until the cache
+        is within its memory budget
+
+        :param tuple key: key of the entry
+        :param pd.DataFrame df: dataframe to cache
+        """
+        size = frame_size(df)
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (df, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self, result_id=None):
+        """
+        Removes all entries or all entries of one result
+
+        :param str result_id: id of the result, the first element of the keys
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if result_id is None or key[0] == result_id:
+                    self.size -= self._entries.pop(key)[1]
+
+
+aggregation_cache = SliceCache(AGGREGATION_CACHE_SIZE)
+
+
+class MemoryBudget:
+    """
+    Tracks the loaded results of all sessions and evicts sections of the least
+    recently used results when their total size exceeds a memory budget
+
+    Results are held by weak references, so results of closed sessions are not kept
+    alive. Results need the attribute last_access and the methods section_sizes,
+    returning the in-memory size of each evictable section, and drop(section),
+    returning False if the section is in use and cannot be dropped.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.evictions = 0
+        self._results = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def register(self, result):
+        """
+        Starts tracking a result
+
+        :param result: loaded result
+        """
+        with self._lock:
+            self._results[id(result)] = result
+
+    def get_size(self):
+        """
+        Computes the size of the sections of all tracked results
+
+        :return: size in bytes
+        """
+        with self._lock:
+            results = list(self._results.values())
+        return sum(sum(result.section_sizes().values()) for result in results)
+
+    def enforce(self, keep=None):
+        """
+        Drops sections of the least recently used results, largest first, until
+        the tracked results are within the memory budget
+
+        :param keep: result whose sections are not dropped, e.g. the one being loaded
+        """
+        with self._lock:
+            results = sorted(self._results.values(), key=lambda r: r.last_access)
+            sizes = {id(result): result.section_sizes() for result in results}
+            total_size = sum(sum(size.values()) for size in sizes.values())
+            for result in results:
+                if total_size <= self.max_size:
+                    break
+                if result is keep:
+                    continue
+                for section, size in sorted(
+                    sizes[id(result)].items(), key=lambda item: -item[1]
+                ):
+                    if total_size <= self.max_size:
+                        break
+                    if result.drop(section, evicted=True):
+                        total_size -= size
+                        self.evictions += 1
+
+
+result_memory = MemoryBudget(RESULT_MEMORY_SIZE)